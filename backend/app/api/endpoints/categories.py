@@ -1,83 +1,129 @@
 
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import List
 import sqlite3
 
-from app.core.database import get_db_connection
-from app.schemas.category import Category, SubCategory, CategoryCreate, CategoryUpdate
+from app.core.pool import get_db, get_read_db
+from app.schemas.category import Category, SubCategory, CategoryCreate, CategoryUpdate, CategoryBulkChanges
 
 router = APIRouter()
 
-def get_db():
-    conn = get_db_connection()
-    try:
-        conn.row_factory = sqlite3.Row
-        yield conn
-    finally:
-        conn.close()
-
 @router.get("/", response_model=List[Category])
-def read_categories(db: sqlite3.Connection = Depends(get_db)):
+def read_categories(request: Request, response: Response, db: sqlite3.Connection = Depends(get_read_db)):
     """
     Get all categories with their subcategories structured hierarchically.
+    Sends an ETag (categories_version, bumped by triggers on every change),
+    so clients can revalidate with If-None-Match and get a 304.
     """
-    # Fetch all categories - Updated column names
-    cursor = db.execute("SELECT category_id, category, parent_id FROM categories ORDER BY category")
-    rows = cursor.fetchall()
-    
-    # Organize into dicts
-    categories_map = {}
+    version = db.execute("SELECT value FROM meta WHERE key = 'categories_version'").fetchone()[0]
+    etag = f'W/"{version}"'
+    if etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, max-age=60"
+
+    # Walk the tree in SQL: rows come back depth-first, siblings sorted by name.
+    # path uses char(31) as separator so a parent always sorts right before its children.
+    cursor = db.execute("""
+        WITH RECURSIVE tree(category_id, category, parent_id, depth, path) AS (
+            SELECT category_id, category, parent_id, 0, category
+            FROM categories
+            WHERE parent_id IS NULL
+            UNION ALL
+            SELECT c.category_id, c.category, c.parent_id, tree.depth + 1,
+                   tree.path || char(31) || c.category
+            FROM categories c
+            JOIN tree ON c.parent_id = tree.category_id
+        )
+        SELECT category_id, category, parent_id, depth FROM tree ORDER BY path
+    """)
+
+    # Single pass: stack[d] holds the last node seen at depth d
     roots = []
-    
-    # First pass: Create objects
-    raw_cats = []
-    for row in rows:
-        cat_dict = dict(row)
-        cat_dict['subcategories'] = []
-        raw_cats.append(cat_dict)
-        categories_map[cat_dict['category_id']] = cat_dict
-
-    # Second pass: Build tree
-    for cat in raw_cats:
-        if cat['parent_id'] is None:
+    stack = []
+    for category_id, name, parent_id, depth in cursor:
+        cat = {
+            'category_id': category_id,
+            'category': name,
+            'parent_id': parent_id,
+            'subcategories': []
+        }
+        del stack[depth:]
+        if depth == 0:
             roots.append(cat)
         else:
-            parent = categories_map.get(cat['parent_id'])
-            if parent:
-                parent['subcategories'].append(cat)
-    
+            stack[-1]['subcategories'].append(cat)
+        stack.append(cat)
+
     return roots
 
+def insert_category(db: sqlite3.Connection, category: CategoryCreate):
+    """
+    Validates and inserts one category (no commit), raising HTTPException 400 on a bad parent or duplicate name.
+    """
+    if category.parent_id:
+        # Verify parent exists
+        cur = db.execute("SELECT category_id FROM categories WHERE category_id = ?", (category.parent_id,))
+        if not cur.fetchone():
+            raise HTTPException(status_code=400, detail="Parent category not found")
+    
+    # Check duplicate name under same parent
+    query = "SELECT category_id FROM categories WHERE category = ? AND parent_id IS ?"
+    # Note: SQLite comparison with NULL needs IS, but parameter binding usually handles it if we are careful.
+    # Actually standard SQL: WHERE category = ? AND (parent_id = ? OR (parent_id IS NULL AND ? IS NULL))
+    
+    # Simplified check logic in python to avoid SQL complexity with Nulls
+    existing = db.execute("SELECT category_id FROM categories WHERE category = ? AND (parent_id = ? OR (? IS NULL AND parent_id IS NULL))", 
+                        (category.category, category.parent_id, category.parent_id)).fetchone()
+    
+    if existing:
+         raise HTTPException(status_code=400, detail="Category with this name already exists in this group")
+
+    db.execute(
+        "INSERT INTO categories (category, parent_id) VALUES (?, ?)",
+        (category.category, category.parent_id)
+    )
+
 @router.post("/", response_model=CategoryCreate)
 def create_category(category: CategoryCreate, db: sqlite3.Connection = Depends(get_db)):
     try:
-        if category.parent_id:
-            # Verify parent exists
-            cur = db.execute("SELECT category_id FROM categories WHERE category_id = ?", (category.parent_id,))
-            if not cur.fetchone():
-                raise HTTPException(status_code=400, detail="Parent category not found")
-        
-        # Check duplicate name under same parent
-        query = "SELECT category_id FROM categories WHERE category = ? AND parent_id IS ?"
-        # Note: SQLite comparison with NULL needs IS, but parameter binding usually handles it if we are careful.
-        # Actually standard SQL: WHERE category = ? AND (parent_id = ? OR (parent_id IS NULL AND ? IS NULL))
-        
-        # Simplified check logic in python to avoid SQL complexity with Nulls
-        existing = db.execute("SELECT category_id FROM categories WHERE category = ? AND (parent_id = ? OR (? IS NULL AND parent_id IS NULL))", 
-                            (category.category, category.parent_id, category.parent_id)).fetchone()
-        
-        if existing:
-             raise HTTPException(status_code=400, detail="Category with this name already exists in this group")
-
-        cursor = db.execute(
-            "INSERT INTO categories (category, parent_id) VALUES (?, ?)",
-            (category.category, category.parent_id)
-        )
+        insert_category(db, category)
         db.commit()
         return category
     except sqlite3.IntegrityError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/bulk", status_code=204, response_class=Response)
+def save_categories_bulk(changes: CategoryBulkChanges, db: sqlite3.Connection = Depends(get_db)):
+    """
+    Apply a whole Categories editor save (deletes, renames, creates) in one request and one DB transaction.
+    Deletes go first, so a removed name can be re-added in the same save.
+    All-or-nothing: the first failing change rolls everything back with its error.
+    """
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        for category_id in changes.delete:
+            delete_category_row(db, category_id)
+        for rename in changes.update:
+            cursor = db.execute(
+                "UPDATE categories SET category = ? WHERE category_id = ?",
+                (rename.category, rename.category_id)
+            )
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=404, detail=f"Category not found: {rename.category_id}")
+        for category in changes.create:
+            insert_category(db, category)
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    except sqlite3.IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.put("/{category_id}", response_model=CategoryUpdate)
 def update_category(category_id: int, update_data: CategoryUpdate, db: sqlite3.Connection = Depends(get_db)):
     cursor = db.execute("SELECT category_id FROM categories WHERE category_id = ?", (category_id,))
@@ -94,22 +140,29 @@ def update_category(category_id: int, update_data: CategoryUpdate, db: sqlite3.C
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=400, detail="Category name conflict")
 
-@router.delete("/{category_id}")
-def delete_category(category_id: int, db: sqlite3.Connection = Depends(get_db)):
+def delete_category_row(db: sqlite3.Connection, category_id: int):
+    """
+    Deletes one category (no commit) if it is safe to, raising HTTPException 404/400 otherwise.
+    """
+    # All pre-delete checks in one round-trip
+    found, has_children, in_use = db.execute("""
+        SELECT
+            EXISTS(SELECT 1 FROM categories WHERE category_id = :id),
+            EXISTS(SELECT 1 FROM categories WHERE parent_id = :id),
+            EXISTS(SELECT 1 FROM transaction_classifications WHERE category_id = :id)
+    """, {"id": category_id}).fetchone()
+
     # 1. Check if category exists
-    cursor = db.execute("SELECT category_id FROM categories WHERE category_id = ?", (category_id,))
-    if not cursor.fetchone():
+    if not found:
         raise HTTPException(status_code=404, detail="Category not found")
 
     # 2. Check for subcategories
-    cursor = db.execute("SELECT category_id FROM categories WHERE parent_id = ?", (category_id,))
-    if cursor.fetchone():
+    if has_children:
         raise HTTPException(status_code=400, detail="Cannot delete category containing subcategories. Delete them first.")
 
     # 3. Check for usage in transactions
     # Note: Using the new column category_id in transactions tables
-    cursor = db.execute("SELECT 1 FROM transaction_classifications WHERE category_id = ?", (category_id,))
-    if cursor.fetchone():
+    if in_use:
         raise HTTPException(status_code=400, detail="Cannot delete category assigned to transactions.")
         
     # 4. Check for usage in rules
@@ -119,7 +172,9 @@ def delete_category(category_id: int, db: sqlite3.Connection = Depends(get_db)):
     # or strict if we want. Let's just delete from categories table for now.
     
     db.execute("DELETE FROM categories WHERE category_id = ?", (category_id,))
+
+@router.delete("/{category_id}", status_code=204, response_class=Response)
+def delete_category(category_id: int, db: sqlite3.Connection = Depends(get_db)):
+    delete_category_row(db, category_id)
     db.commit()
-    
-    return Response(status_code=204)
 
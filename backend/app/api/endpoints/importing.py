@@ -1,12 +1,14 @@
+import asyncio
 import os
-import shutil
 import uuid
-import sqlite3
+import aiofiles
+from concurrent.futures import Executor
 from pathlib import Path
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from app.core.database import get_db_connection
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, UploadFile, File
+from app.core.pool import init_pool
 from app.core.config import DATA_DIR
-from app.services.importer import import_file
+from app.services.importer import import_file, import_file_standalone
 from app.services.classifier import run_classification
 
 router = APIRouter()
@@ -15,20 +17,36 @@ router = APIRouter()
 UPLOAD_DIR = DATA_DIR / "uploads"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-# Dependency to get DB connection per request
-def get_db():
-    conn = get_db_connection()
-    try:
-        conn.row_factory = sqlite3.Row
-        yield conn
-    finally:
-        conn.close()
+# Upload is streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Uploads bigger than this are imported in a worker process, smaller ones in a thread
+# (spinning up a process isn't worth it for a typical monthly statement)
+IMPORT_PROCESS_THRESHOLD = 8 << 20
+
+def import_and_classify(path: str, on_conflict: str, import_pool: Optional[Executor] = None):
+    """
+    Import a saved upload and classify the new rows, holding the writer connection
+    only for that (not for the network upload before it). Runs in a worker thread.
+    With import_pool, the import itself runs there on its own connection; the writer
+    is still held so no other write lands in between.
+    """
+    with init_pool().connection() as db:
+        if import_pool is not None:
+            # The worker process opens its own connection; only the path crosses over
+            import_result = import_pool.submit(import_file_standalone, path, on_conflict).result()
+        else:
+            import_result = import_file(path, db, on_conflict=on_conflict)
+        
+        # Trigger automatic classification for newly added transactions
+        classification_result = run_classification(db)
+    return import_result, classification_result
 
 @router.post("/upload")
 async def upload_csv(
+    request: Request,
     file: UploadFile = File(...),
-    on_conflict: str = "ignore",
-    db: sqlite3.Connection = Depends(get_db)
+    on_conflict: str = "ignore"
 ):
     """
     Receive a CSV file, save it to data/uploads/, process it, and cleanup.
@@ -41,22 +59,28 @@ async def upload_csv(
     temp_path = UPLOAD_DIR / unique_filename
 
     try:
-        # 1. Save uploaded file to the data/uploads folder
-        with temp_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # 1. Stream uploaded file to the data/uploads folder without blocking the event loop
+        size = 0
+        async with aiofiles.open(temp_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                await buffer.write(chunk)
         
-        # 2. Call the existing importer service
+        # 2. Import and classify off the event loop (only now is the writer taken)
         # Note: import_file expects a string path
-        import_result = import_file(str(temp_path), db, on_conflict=on_conflict)
-        
-        # 3. Trigger automatic classification for newly added transactions
-        classification_result = run_classification(db)
+        import_pool = request.app.state.import_pool if size > IMPORT_PROCESS_THRESHOLD else None
+        import_result, classification_result = await asyncio.to_thread(
+            import_and_classify, str(temp_path), on_conflict, import_pool
+        )
         
         return {
             "import": import_result,
             "classification": classification_result
         }
 
+    except HTTPException:
+        # e.g. 503 when the writer stays busy
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -1,57 +1,35 @@
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from typing import List
 import sqlite3
 
-from app.core.database import get_db_connection
-from app.schemas.rule import Rule, RuleCreate, RuleUpdate
+from app.core.pool import get_db, get_read_db
+from app.schemas.rule import Rule, RuleBulkItem, RuleCreate, RuleUpdate
+from app.services.categories_manager import CATEGORY_ID_LOOKUP
 
 router = APIRouter()
 
-def get_db():
-    conn = get_db_connection()
-    try:
-        conn.row_factory = sqlite3.Row
-        yield conn
-    finally:
-        conn.close()
+# category_id is resolved inside the statement itself
+INSERT_RULE = f"""
+    INSERT INTO rules (pattern, match_type, source_column, merchant, 
+                       category, subcategory, category_id, conditions, priority)
+    VALUES (:pattern, :match_type, :source_column, :merchant,
+            :category, :subcategory, {CATEGORY_ID_LOOKUP}, :conditions, :priority)
+    RETURNING id, category_id
+"""
 
-def resolve_category_id(db: sqlite3.Connection, category: str, subcategory: str = None) -> int:
-    """
-    Helper to find category_id based on names.
-    """
-    if not category:
-        return None
-    
-    cat_id = None
-    
-    if subcategory:
-        # Try to find specific child
-        query = """
-        SELECT c.category_id 
-        FROM categories c
-        JOIN categories p ON c.parent_id = p.category_id
-        WHERE c.category = ? AND p.category = ?
-        """
-        cur = db.execute(query, (subcategory, category))
-        row = cur.fetchone()
-        if row:
-            cat_id = row[0]
-            
-    # If not found (or no subcategory), try finding just the parent
-    # Note: If user provided a subcategory that doesn't match the parent in DB, 
-    # we might fallback to parent ID or leave None. This logic prioritizes exact match.
-    if cat_id is None:
-        query = "SELECT category_id FROM categories WHERE category = ? AND parent_id IS NULL"
-        cur = db.execute(query, (category,))
-        row = cur.fetchone()
-        if row:
-            cat_id = row[0]
-            
-    return cat_id
+# No row returned means the rule doesn't exist
+UPDATE_RULE = f"""
+    UPDATE rules 
+    SET pattern=:pattern, match_type=:match_type, source_column=:source_column, merchant=:merchant,
+        category=:category, subcategory=:subcategory, category_id={CATEGORY_ID_LOOKUP},
+        conditions=:conditions, priority=:priority
+    WHERE id = :rule_id
+    RETURNING category_id
+"""
 
 @router.get("/", response_model=List[Rule])
-def read_rules(db: sqlite3.Connection = Depends(get_db)):
+def read_rules(db: sqlite3.Connection = Depends(get_read_db)):
     cursor = db.execute("""
         SELECT id, pattern, match_type, source_column, merchant, 
                category, subcategory, category_id, conditions, priority 
@@ -63,52 +41,51 @@ def read_rules(db: sqlite3.Connection = Depends(get_db)):
 
 @router.post("/", response_model=Rule)
 def create_rule(rule: RuleCreate, db: sqlite3.Connection = Depends(get_db)):
-    # 1. Resolve category_id
-    cat_id = resolve_category_id(db, rule.category, rule.subcategory)
-    
-    # 2. Insert
-    query = """
-        INSERT INTO rules (pattern, match_type, source_column, merchant, 
-                           category, subcategory, category_id, conditions, priority)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
-    cursor = db.execute(query, (
-        rule.pattern, rule.match_type, rule.source_column, rule.merchant,
-        rule.category, rule.subcategory, cat_id, rule.conditions, rule.priority
-    ))
+    new_id, cat_id = db.execute(INSERT_RULE, rule.dict()).fetchone()
     db.commit()
-    new_id = cursor.lastrowid
     
     return {**rule.dict(), "id": new_id, "category_id": cat_id}
 
+@router.post("/bulk", response_model=List[Rule])
+def save_rules_bulk(rules: List[RuleBulkItem], db: sqlite3.Connection = Depends(get_db)):
+    """
+    Create and update many rules in a single DB transaction (one request instead of one per rule).
+    Items with an id update that rule, items without one are created.
+    All-or-nothing: an unknown id rolls everything back with a 404.
+    """
+    results = []
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        for rule in rules:
+            params = rule.dict(exclude={"id"})
+            if rule.id is None:
+                new_id, cat_id = db.execute(INSERT_RULE, params).fetchone()
+            else:
+                row = db.execute(UPDATE_RULE, {**params, "rule_id": rule.id}).fetchone()
+                if row is None:
+                    raise HTTPException(status_code=404, detail=f"Rule not found: {rule.id}")
+                new_id, cat_id = rule.id, row[0]
+            results.append({**params, "id": new_id, "category_id": cat_id})
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return results
+
 @router.put("/{rule_id}", response_model=Rule)
 def update_rule(rule_id: int, rule: RuleUpdate, db: sqlite3.Connection = Depends(get_db)):
-    # Check if exists
-    check = db.execute("SELECT id FROM rules WHERE id = ?", (rule_id,)).fetchone()
-    if not check:
+    row = db.execute(UPDATE_RULE, {**rule.dict(), "rule_id": rule_id}).fetchone()
+    if row is None:
         raise HTTPException(status_code=404, detail="Rule not found")
-        
-    # 1. Resolve category_id
-    cat_id = resolve_category_id(db, rule.category, rule.subcategory)
-    
-    # 2. Update
-    query = """
-        UPDATE rules 
-        SET pattern=?, match_type=?, source_column=?, merchant=?,
-            category=?, subcategory=?, category_id=?, conditions=?, priority=?
-        WHERE id = ?
-    """
-    db.execute(query, (
-        rule.pattern, rule.match_type, rule.source_column, rule.merchant,
-        rule.category, rule.subcategory, cat_id, rule.conditions, rule.priority,
-        rule_id
-    ))
     db.commit()
     
-    return {**rule.dict(), "id": rule_id, "category_id": cat_id}
+    return {**rule.dict(), "id": rule_id, "category_id": row[0]}
 
-@router.delete("/{rule_id}")
+@router.delete("/{rule_id}", status_code=204, response_class=Response)
 def delete_rule(rule_id: int, db: sqlite3.Connection = Depends(get_db)):
     db.execute("DELETE FROM rules WHERE id = ?", (rule_id,))
     db.commit()
-    return {"message": "Rule deleted"}
@@ -1,62 +1,131 @@
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from typing import List, Optional
+from collections import OrderedDict
+from datetime import date
 import sqlite3
 import hashlib
+import threading
 
-from app.core.database import get_db_connection
-from app.schemas.transaction import Transaction, TransactionUpdate, TransactionCreate
+from app.core.database import bump_version
+from app.core.pool import get_db, get_read_db
+from app.core.responses import ARROW_STREAM_MEDIA_TYPE, ORJSONResponse, render_arrow_stream, wants_arrow
+from app.schemas.transaction import Transaction, TransactionUpdate, TransactionCreate, TransactionCategorizeItem
+from app.services.categories_manager import CATEGORY_ID_LOOKUP, load_category_ids, resolve_category_id
 
 router = APIRouter()
 
+# Kept at module level so the exact same SQL text hits the connection's statement cache.
+# The CURRENT category is denormalized onto transactions (current_* columns, kept in
+# sync by triggers, see sql/schema.sql), so listings read a single table.
+SELECT_TRANSACTIONS = """
+SELECT 
+    t.transaction_id,
+    t.date,
+    t.transaction_type,
+    t.amount,
+    t.currency,
+    t.description,
+    t.country,
+    t.city,
+    t.current_category AS category,
+    t.current_subcategory AS subcategory,
+    t.current_category_id AS category_id,
+    t.current_merchant AS merchant
+FROM transactions t
+"""
+
+SELECT_TRANSACTION_BY_ID = SELECT_TRANSACTIONS + """
+WHERE t.transaction_id = ?
+"""
+
+# Batch lookups bind at most this many IDs per statement
+# (SQLite builds before 3.32 cap host parameters at 999)
+IDS_PER_QUERY = 900
+
+# Newest first; transaction_id breaks ties between same-day rows so pages never overlap
+SELECT_TRANSACTIONS_PAGE = SELECT_TRANSACTIONS + """
+ORDER BY t.date DESC, t.transaction_id DESC
+LIMIT ? OFFSET ?
+"""
+
+# Keyset page: seeks straight to the cursor on idx_transactions_date_id instead of
+# walking and discarding OFFSET rows
+SELECT_TRANSACTIONS_AFTER = SELECT_TRANSACTIONS + """
+WHERE (t.date, t.transaction_id) < (?, ?)
+ORDER BY t.date DESC, t.transaction_id DESC
+LIMIT ?
+"""
+
+# Same two pages restricted to a date window (a range scan on idx_transactions_date_id).
+# Keyset pages only need the lower bound: the cursor already sits inside the window.
+SELECT_TRANSACTIONS_RANGE = SELECT_TRANSACTIONS + """
+WHERE t.date BETWEEN ? AND ?
+ORDER BY t.date DESC, t.transaction_id DESC
+LIMIT ? OFFSET ?
+"""
+
+SELECT_TRANSACTIONS_RANGE_AFTER = SELECT_TRANSACTIONS + """
+WHERE t.date >= ? AND (t.date, t.transaction_id) < (?, ?)
+ORDER BY t.date DESC, t.transaction_id DESC
+LIMIT ?
+"""
+
+INSERT_MANUAL_TRANSACTION = """
+INSERT INTO transactions 
+(transaction_id, date, transaction_type, amount, currency, description, import_batch_id)
+VALUES (?, ?, ?, ?, ?, ?, 'manual')
+"""
+
+# category_id resolved in the same statement (see CATEGORY_ID_LOOKUP)
+INSERT_MANUAL_CLASSIFICATION = f"""
+INSERT INTO transaction_classifications 
+(transaction_id, category, subcategory, merchant, category_id, method, is_current)
+VALUES (:transaction_id, :category, :subcategory, :merchant, {CATEGORY_ID_LOOKUP}, 'manual', 1)
+RETURNING category, subcategory, merchant, category_id
+"""
+
+# Arrow column types of a listing (the rest are text), see render_arrow_stream
+TRANSACTION_ARROW_TYPES = {"amount": "float64", "category_id": "int64"}
+
+# Upper bound for one page (the dashboard loads up to this many rows in one go)
+MAX_PAGE_SIZE = 5000
+
+SELECT_TRANSACTIONS_VERSION = "SELECT value FROM meta WHERE key = 'transactions_version'"
+
+# Rendered list pages (body, media type, cursor headers), keyed by the query parameters.
+# Tagged with meta.transactions_version: once any writer (API, importer, classifier,
+# in any process) bumps it, the whole cache is dropped on the next read.
+# Bounded by body size, not entry count: one full page can be megabytes
+# (oldest pages go first; a page bigger than PAGE_CACHE_MAX_ENTRY_BYTES isn't kept).
+PAGE_CACHE_MAX_BYTES = 64 << 20
+PAGE_CACHE_MAX_ENTRY_BYTES = PAGE_CACHE_MAX_BYTES // 8
+_page_cache = OrderedDict()
+_page_cache_bytes = 0
+_page_cache_version = None
+_page_cache_lock = threading.Lock()
+
 # Helper for ID generation (simplified version of importer's helper)
 def short_hash(*values, length=8) -> str:
+    # Stays SHA-256 so re-created manual entries still collide with stored IDs (409),
+    # but only the bytes we keep get hex-encoded.
     base = "|".join(str(v) for v in values)
-    h = hashlib.sha256(base.encode()).hexdigest()
-    return h[:length]
+    digest = hashlib.sha256(base.encode()).digest()
+    return digest[:(length + 1) // 2].hex()[:length]
 
-# Dependency to get DB connection per request (and close it after)
-def get_db():
-    conn = get_db_connection()
-    try:
-        # Enable row factory to access columns by name
-        conn.row_factory = sqlite3.Row
-        yield conn
-    finally:
-        conn.close()
-
-def resolve_category_id(db: sqlite3.Connection, category: str, subcategory: str = None) -> Optional[int]:
+def manual_transaction_id(tx_data: TransactionCreate) -> str:
     """
-    Helper to find category_id based on names.
-    Note: Ideally this should be in a shared service.
+    Deterministic 'manual-{hash}' ID.
+    Consistent with importer fallback logic but with 'manual-' prefix.
     """
-    if not category:
-        return None
-    
-    cat_id = None
-    
-    if subcategory:
-        # Try to find specific child
-        query = """
-        SELECT c.category_id 
-        FROM categories c
-        JOIN categories p ON c.parent_id = p.category_id
-        WHERE c.category = ? AND p.category = ?
-        """
-        cur = db.execute(query, (subcategory, category))
-        row = cur.fetchone()
-        if row:
-            cat_id = row[0]
-            
-    # If not found (or no subcategory), try finding just the parent
-    if cat_id is None:
-        query = "SELECT category_id FROM categories WHERE category = ? AND parent_id IS NULL"
-        cur = db.execute(query, (category,))
-        row = cur.fetchone()
-        if row:
-            cat_id = row[0]
-            
-    return cat_id
+    sig = short_hash(
+        tx_data.date, 
+        tx_data.transaction_type, 
+        tx_data.amount, 
+        tx_data.currency, 
+        tx_data.description
+    )
+    return f"manual-{sig}"
 
 @router.post("/", response_model=Transaction)
 def create_transaction(
@@ -71,35 +140,20 @@ def create_transaction(
     """
     
     # 1. Generate ID
-    # consistent with importer fallback logic but with 'manual-' prefix
-    sig = short_hash(
-        tx_data.date, 
-        tx_data.transaction_type, 
-        tx_data.amount, 
-        tx_data.currency, 
-        tx_data.description
-    )
-    new_id = f"manual-{sig}"
+    new_id = manual_transaction_id(tx_data)
     
     # 2. Check existence
     existing = db.execute("SELECT transaction_id FROM transactions WHERE transaction_id = ?", (new_id,)).fetchone()
     if existing:
         raise HTTPException(status_code=409, detail=f"Transaction already exists with ID: {new_id}")
 
-    # 3. Resolve Category (if provided)
     cat_id = None
-    if tx_data.category:
-        cat_id = resolve_category_id(db, tx_data.category, tx_data.subcategory)
 
     try:
-        db.execute("BEGIN")
+        db.execute("BEGIN IMMEDIATE")
         
-        # 4. Insert Transaction (Raw Data Only - NO MERCHANT HERE)
-        db.execute("""
-            INSERT INTO transactions 
-            (transaction_id, date, transaction_type, amount, currency, description, import_batch_id)
-            VALUES (?, ?, ?, ?, ?, ?, 'manual')
-        """, (
+        # 3. Insert Transaction (Raw Data Only - NO MERCHANT HERE)
+        db.execute(INSERT_MANUAL_TRANSACTION, (
             new_id,
             tx_data.date.isoformat(),
             tx_data.transaction_type,
@@ -108,31 +162,29 @@ def create_transaction(
             tx_data.description or ""
         ))
         
-        # 5. Insert Classification (Merchant + Category info goes here)
+        # 4. Insert Classification (Merchant + Category info goes here)
         # We always want a classification row for manual entries if category OR merchant is provided.
         # Even if category is missing, merchant might be valuable.
+        # category_id is resolved in the same statement.
         if tx_data.category or tx_data.merchant: 
-            db.execute("""
-                INSERT INTO transaction_classifications 
-                (transaction_id, category, subcategory, merchant, category_id, method, is_current)
-                VALUES (?, ?, ?, ?, ?, 'manual', 1)
-            """, (
-                new_id,
-                tx_data.category,
-                tx_data.subcategory,
-                tx_data.merchant,
-                cat_id
-            ))
+            cat_id = db.execute(INSERT_MANUAL_CLASSIFICATION, {
+                "transaction_id": new_id,
+                "category": tx_data.category,
+                "subcategory": tx_data.subcategory,
+                "merchant": tx_data.merchant
+            }).fetchone()["category_id"]
             
+        bump_version(db, "transactions_version")
         db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
         
     # Construct response object manually to ensure all fields are reflected
+    # (date as stored: ISO string, same as the read endpoints return it)
     return Transaction(
         transaction_id=new_id,
-        date=tx_data.date, 
+        date=tx_data.date.isoformat(), 
         transaction_type=tx_data.transaction_type,
         amount=tx_data.amount,
         currency=tx_data.currency,
@@ -144,73 +196,202 @@ def create_transaction(
     )
 
 
-@router.get("/", response_model=List[Transaction])
-def read_transactions(
-    skip: int = 0,
-    limit: int = 50,
+@router.post("/bulk", response_model=List[Transaction])
+def create_transactions_bulk(
+    tx_list: List[TransactionCreate],
     db: sqlite3.Connection = Depends(get_db)
 ):
     """
-    Get list of transactions.
+    Manually create many transactions in a single DB transaction.
+    Same ID and classification rules as the single create; all-or-nothing on duplicates.
     """
-    # We join with classifications to get the CURRENT category for each transaction
-    query = """
-    SELECT 
-        t.*,
-        tc.category,
-        tc.subcategory,
-        tc.category_id,
-        tc.merchant
-    FROM transactions t
-    LEFT JOIN transaction_classifications tc 
-        ON t.transaction_id = tc.transaction_id 
-        AND tc.is_current = 1
-    ORDER BY t.action_date DESC, t.booking_date DESC
-    LIMIT ? OFFSET ?
+    if not tx_list:
+        return []
+
+    # 1. Generate IDs and reject duplicates (inside the payload or already stored)
+    new_ids = [manual_transaction_id(tx) for tx in tx_list]
+    if len(set(new_ids)) != len(new_ids):
+        raise HTTPException(status_code=409, detail="Duplicate transactions in request")
+
+    placeholders = ",".join("?" * len(new_ids))
+    existing = db.execute(
+        f"SELECT transaction_id FROM transactions WHERE transaction_id IN ({placeholders})", new_ids
+    ).fetchall()
+    if existing:
+        raise HTTPException(status_code=409, detail=f"Transactions already exist with IDs: {[r[0] for r in existing]}")
+
+    # 2. Resolve category_ids from the cached category map
+    category_ids = load_category_ids(db)
+
+    tx_rows = []
+    classification_rows = []
+    results = []
+    for new_id, tx in zip(new_ids, tx_list):
+        cat_id = resolve_category_id(category_ids, tx.category, tx.subcategory)
+
+        tx_rows.append((
+            new_id,
+            tx.date.isoformat(),
+            tx.transaction_type,
+            tx.amount,
+            tx.currency,
+            tx.description or ""
+        ))
+        if tx.category or tx.merchant:
+            classification_rows.append((new_id, tx.category, tx.subcategory, tx.merchant, cat_id))
+
+        results.append(Transaction(
+            transaction_id=new_id,
+            date=tx.date.isoformat(),
+            transaction_type=tx.transaction_type,
+            amount=tx.amount,
+            currency=tx.currency,
+            description=tx.description or "",
+            merchant=tx.merchant,
+            category=tx.category,
+            subcategory=tx.subcategory,
+            category_id=cat_id
+        ))
+
+    # 3. Insert everything, commit once
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        db.executemany(INSERT_MANUAL_TRANSACTION, tx_rows)
+        db.executemany("""
+            INSERT INTO transaction_classifications 
+            (transaction_id, category, subcategory, merchant, category_id, method, is_current)
+            VALUES (?, ?, ?, ?, ?, 'manual', 1)
+        """, classification_rows)
+        bump_version(db, "transactions_version")
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return results
+
+
+# Plain `def` on purpose: every step (version check, cache lookup, query, orjson) is
+# either blocking sqlite3 or sub-millisecond CPU, so one threadpool hop for the whole
+# handler is cheaper than an async handler hopping to a thread around each DB call.
+@router.get("/", response_model=List[Transaction])
+def read_transactions(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    after_date: Optional[str] = None,
+    after_id: Optional[str] = None,
+    start: Optional[date] = Query(None, description="First date to include (YYYY-MM-DD)"),
+    end: Optional[date] = Query(None, description="Last date to include (YYYY-MM-DD)"),
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: sqlite3.Connection = Depends(get_read_db)
+):
     """
-    # Wait, original schema didn't have action_date/booking_date, just date.
-    # Let me revert to using just 'date'.
-    
-    query = """
-    SELECT 
-        t.*,
-        tc.category,
-        tc.subcategory,
-        tc.category_id,
-        tc.merchant
-    FROM transactions t
-    LEFT JOIN transaction_classifications tc 
-        ON t.transaction_id = tc.transaction_id 
-        AND tc.is_current = 1
-    ORDER BY t.date DESC
-    LIMIT ? OFFSET ?
+    Get list of transactions, newest first.
+    start / end (inclusive) restrict the list to a date window, filtered in SQL.
+    Pass the X-Next-After-Date / X-Next-After-Id headers of a page back as
+    after_date / after_id to get the next one (skip is kept for old clients).
+    Send `Accept: application/vnd.apache.arrow.stream` to get the page as an
+    Arrow IPC stream instead of JSON (same columns).
+    Pages are served from an in-process cache until the data changes.
+    Sends an ETag (transactions_version), so clients holding a page can
+    revalidate with If-None-Match and get a 304 instead of the rows again.
     """
-    cursor = db.execute(query, (limit, skip))
+    global _page_cache_version, _page_cache_bytes
+    arrow = wants_arrow(accept)
+
+    # Version first, page second: a write landing in between only makes the cached
+    # page newer than its tag, and the next read drops it anyway
+    version = db.execute(SELECT_TRANSACTIONS_VERSION).fetchone()[0]
+    etag = f'W/"{version}"'
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    key = (skip, limit, after_date, after_id, start, end, arrow)
+    with _page_cache_lock:
+        if _page_cache_version != version:
+            _page_cache.clear()
+            _page_cache_bytes = 0
+            _page_cache_version = version
+        cached = _page_cache.get(key)
+        if cached is not None:
+            _page_cache.move_to_end(key)
+    if cached is not None:
+        body, media_type, headers = cached
+        return Response(content=body, media_type=media_type, headers={**headers, "ETag": etag})
+
+    # Plain tuples instead of sqlite3.Row: rows are zipped with the column names once
+    cursor = db.cursor()
+    cursor.row_factory = None
+    windowed = start is not None or end is not None
+    low = start.isoformat() if start is not None else ""
+    high = end.isoformat() if end is not None else "9999-12-31"
+    if after_date is not None and after_id is not None:
+        if windowed:
+            cursor.execute(SELECT_TRANSACTIONS_RANGE_AFTER, (low, after_date, after_id, limit))
+        else:
+            cursor.execute(SELECT_TRANSACTIONS_AFTER, (after_date, after_id, limit))
+    elif windowed:
+        cursor.execute(SELECT_TRANSACTIONS_RANGE, (low, high, limit, skip))
+    else:
+        cursor.execute(SELECT_TRANSACTIONS_PAGE, (limit, skip))
+    columns = [d[0] for d in cursor.description]
     rows = cursor.fetchall()
     
-    # Convert sqlite3.Row objects to dicts matching our Schema
-    results = []
-    for row in rows:
-        results.append(dict(row))
-    
-    return results
+    # Rows come straight from our own SELECT (already in the Transaction shape),
+    # so return them as-is and skip response_model re-validation.
+    # response_model is kept for the OpenAPI docs.
+    if arrow:
+        response = Response(content=render_arrow_stream(columns, rows, TRANSACTION_ARROW_TYPES), media_type=ARROW_STREAM_MEDIA_TYPE)
+    else:
+        response = ORJSONResponse([dict(zip(columns, row)) for row in rows])
 
-@router.get("/{transaction_id}", response_model=Transaction)
-def read_transaction(transaction_id: str, db: sqlite3.Connection = Depends(get_db)):
-    query = """
-    SELECT 
-        t.*,
-        tc.category,
-        tc.subcategory,
-        tc.category_id,
-        tc.merchant
-    FROM transactions t
-    LEFT JOIN transaction_classifications tc 
-        ON t.transaction_id = tc.transaction_id 
-        AND tc.is_current = 1
-    WHERE t.transaction_id = ?
+    # A full page means there may be more: hand out the cursor for the next one
+    if rows and len(rows) == limit:
+        date_idx = columns.index("date")
+        id_idx = columns.index("transaction_id")
+        response.headers["X-Next-After-Date"] = rows[-1][date_idx]
+        response.headers["X-Next-After-Id"] = rows[-1][id_idx]
+    response.headers["ETag"] = etag
+
+    with _page_cache_lock:
+        if _page_cache_version == version and len(response.body) <= PAGE_CACHE_MAX_ENTRY_BYTES:
+            old = _page_cache.pop(key, None)
+            if old is not None:
+                _page_cache_bytes -= len(old[0])
+            _page_cache[key] = (response.body, response.media_type, {
+                name: value for name, value in response.headers.items() if name.startswith("x-next-")
+            })
+            _page_cache_bytes += len(response.body)
+            while _page_cache_bytes > PAGE_CACHE_MAX_BYTES:
+                _, (evicted, _, _) = _page_cache.popitem(last=False)
+                _page_cache_bytes -= len(evicted)
+
+    return response
+
+@router.get("/batch", response_model=List[Transaction])
+def read_transactions_by_ids(
+    ids: str = Query(..., description="Comma-separated transaction IDs"),
+    db: sqlite3.Connection = Depends(get_read_db)
+):
+    """
+    Get many transactions by ID in one request (WHERE IN instead of one call per ID).
+    Returned in the order asked for; unknown IDs are left out.
     """
-    cursor = db.execute(query, (transaction_id,))
+    wanted = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+
+    found = {}
+    for start in range(0, len(wanted), IDS_PER_QUERY):
+        chunk = wanted[start:start + IDS_PER_QUERY]
+        placeholders = ",".join("?" * len(chunk))
+        for row in db.execute(f"{SELECT_TRANSACTIONS} WHERE t.transaction_id IN ({placeholders})", chunk):
+            found[row["transaction_id"]] = dict(row)
+
+    return [found[i] for i in wanted if i in found]
+
+@router.get("/{transaction_id}", response_model=Transaction)
+def read_transaction(transaction_id: str, db: sqlite3.Connection = Depends(get_read_db)):
+    cursor = db.execute(SELECT_TRANSACTION_BY_ID, (transaction_id,))
     row = cursor.fetchone()
     if row is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
@@ -226,41 +407,72 @@ def categorize_transaction(
     Manually categorize a transaction.
     Adds a new record to transaction_classifications with method='manual'.
     """
-    # 1. Verify transaction exists
-    check = db.execute("SELECT transaction_id FROM transactions WHERE transaction_id = ?", (transaction_id,)).fetchone()
-    if not check:
+    # 1. Verify transaction exists (and keep its columns for the response)
+    tx_row = db.execute(SELECT_TRANSACTION_BY_ID, (transaction_id,)).fetchone()
+    if not tx_row:
         raise HTTPException(status_code=404, detail="Transaction not found")
         
-    # 2. Resolve category_id
-    cat_id = resolve_category_id(db, update_data.category, update_data.subcategory)
-    
     try:
-        db.execute("BEGIN")
-        
-        # 3. Mark existing current classifications as not current
-        db.execute("""
-            UPDATE transaction_classifications 
-            SET is_current = 0 
-            WHERE transaction_id = ? AND is_current = 1
-        """, (transaction_id,))
-        
-        # 4. Insert new classification
-        db.execute("""
-            INSERT INTO transaction_classifications 
-            (transaction_id, category, subcategory, merchant, category_id, method, is_current)
-            VALUES (?, ?, ?, ?, ?, 'manual', 1)
-        """, (
-            transaction_id,
-            update_data.category,
-            update_data.subcategory,
-            update_data.merchant,
-            cat_id
-        ))
+        # 2. Insert new classification (category_id resolved in the same statement).
+        # The previous current classification is retired by trg_tx_classif_retire_current.
+        classification = db.execute(INSERT_MANUAL_CLASSIFICATION, {
+            "transaction_id": transaction_id,
+            "category": update_data.category,
+            "subcategory": update_data.subcategory,
+            "merchant": update_data.merchant
+        }).fetchone()
+        bump_version(db, "transactions_version")
         
         db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-    # 5. Return updated transaction
-    return read_transaction(transaction_id, db)
+    # 3. Return updated transaction, built from rows we already have
+    return {**dict(tx_row), **dict(classification)}
+
+@router.post("/bulk_categorize", response_model=List[Transaction])
+def categorize_transactions_bulk(
+    updates: List[TransactionCategorizeItem],
+    db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Manually categorize many transactions in a single DB transaction
+    (one request instead of one PUT per edited row).
+    All-or-nothing: an unknown transaction_id rolls everything back with a 404.
+    Items without a category are rejected up front with a 422 (nothing is written).
+    """
+    # A classification needs a category (NOT NULL): name the offending items
+    # instead of failing halfway through with a constraint error
+    missing_category = [item.transaction_id for item in updates if not item.category]
+    if missing_category:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Category is required for: {', '.join(missing_category)}"
+        )
+
+    results = []
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        for item in updates:
+            tx_row = db.execute(SELECT_TRANSACTION_BY_ID, (item.transaction_id,)).fetchone()
+            if not tx_row:
+                raise HTTPException(status_code=404, detail=f"Transaction not found: {item.transaction_id}")
+            classification = db.execute(INSERT_MANUAL_CLASSIFICATION, {
+                "transaction_id": item.transaction_id,
+                "category": item.category,
+                "subcategory": item.subcategory,
+                "merchant": item.merchant
+            }).fetchone()
+            results.append({**dict(tx_row), **dict(classification)})
+        if results:
+            bump_version(db, "transactions_version")
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return results
@@ -1,10 +1,35 @@
 import sqlite3
 import os
+from pathlib import Path
 from .config import DB_PATH
 
-def get_db_connection():
+# Applied once per connection (the API pools its connections, so not per request).
+# WAL lets readers run alongside the single writer; NORMAL sync is safe in WAL mode.
+# Lock waits are covered by sqlite3.connect's timeout (5 s busy handler).
+WRITE_PRAGMAS = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+"""
+
+# Per-connection settings that are also allowed on read-only connections
+CONNECTION_PRAGMAS = """
+PRAGMA foreign_keys = ON;
+PRAGMA temp_store = MEMORY;
+PRAGMA mmap_size = 268435456;
+PRAGMA cache_size = -65536;
+"""
+
+def bump_version(conn: sqlite3.Connection, key: str):
+    """
+    Increment a meta counter (e.g. 'transactions_version') so caches tagged with it go stale.
+    Call it in the same transaction as the write, or right after it.
+    """
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key = ?", (key,))
+
+def get_db_connection(readonly: bool = False):
     """
-    Returns a raw sqlite3 connection.
+    Returns a raw sqlite3 connection, tuned with the PRAGMAs above and in autocommit mode.
+    readonly=True opens the file with mode=ro: any write fails instead of taking a lock.
     """
     # Debug: Print where we are looking for the DB
     if not os.path.exists(DB_PATH):
@@ -12,5 +37,16 @@ def get_db_connection():
         # We assume the API strictly needs the DB to exist.
     
     # Enable check_same_thread=False to avoid threading issues with FastAPI reloading
-    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
+    # cached_statements: pooled connections live long, so keep every endpoint's SQL prepared
+    if readonly:
+        uri = Path(DB_PATH).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=256)
+    else:
+        conn = sqlite3.connect(str(DB_PATH), check_same_thread=False, cached_statements=256)
+        conn.executescript(WRITE_PRAGMAS)
+    conn.executescript(CONNECTION_PRAGMAS)
+    # Autocommit: single statements commit on their own, multi-statement writes
+    # open the transaction explicitly (BEGIN IMMEDIATE takes the write lock up front
+    # instead of upgrading a read lock halfway, which is what ends in SQLITE_BUSY)
+    conn.isolation_level = None
     return conn
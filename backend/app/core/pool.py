@@ -0,0 +1,131 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from fastapi import HTTPException
+
+from .database import get_db_connection
+
+# How long a request waits for the writer before giving up with a 503.
+# Waiting threads hold FastAPI threadpool tokens, so the wait must be bounded:
+# unbounded, enough waiters leave no token for the request that holds the writer.
+WRITE_LOCK_TIMEOUT = 5.0
+
+class ConnectionPool:
+    """
+    Keeps sqlite3 connections open between requests, split the way SQLite works in WAL mode:
+    - `size` read-only connections, borrowed by read endpoints (readers never block each other;
+      past `size` concurrent reads a temporary connection is opened instead of waiting)
+    - one writer connection, handed out under a lock (SQLite allows a single writer anyway,
+      so queueing here beats bouncing off SQLITE_BUSY), waited for at most WRITE_LOCK_TIMEOUT
+    Everything is opened up front, so file handles and page caches stay warm.
+    """
+
+    def __init__(self, size: int = 8):
+        self.size = size
+        # Writer first: it switches the file to WAL, which read-only connections can't do
+        self._writer = self._create()
+        self._write_lock = threading.Lock()
+        # LIFO: the most recently used connection has the hottest cache
+        self._readers = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._readers.put_nowait(self._create(readonly=True))
+
+    def _create(self, readonly: bool = False) -> sqlite3.Connection:
+        # PRAGMAs and autocommit are set up by get_db_connection
+        conn = get_db_connection(readonly=readonly)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow the writer connection (waits while another request is writing,
+        HTTPException 503 if it isn't free within WRITE_LOCK_TIMEOUT).
+        """
+        if not self._write_lock.acquire(timeout=WRITE_LOCK_TIMEOUT):
+            raise HTTPException(
+                status_code=503,
+                detail="Database is busy with another write, try again",
+                headers={"Retry-After": "1"}
+            )
+        try:
+            yield self._writer
+        finally:
+            # Never hand out a connection with a dangling transaction
+            if self._writer.in_transaction:
+                self._writer.rollback()
+            self._write_lock.release()
+
+    @contextmanager
+    def read_connection(self):
+        """
+        Borrow a read-only connection. Never waits: if all of them are in use,
+        a temporary one is opened and closed afterwards.
+        """
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = self._create(readonly=True)
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._readers.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+        with self._write_lock:
+            # Refresh planner statistics where the data changed enough (cheap, usually a no-op),
+            # so the join and keyset indexes keep being picked on long-lived databases
+            self._writer.execute("PRAGMA optimize")
+            self._writer.close()
+
+
+_pool = None
+# Requests can race to create the pool (when the lifespan didn't): a second pool
+# would mean a second writer connection, outside the write lock
+_pool_lock = threading.Lock()
+
+def init_pool(size: int = 8) -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(size)
+    return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def get_db():
+    """
+    FastAPI dependency: borrow the writer connection for the duration of a request.
+    Use for endpoints that write.
+    """
+    pool = init_pool()
+    with pool.connection() as conn:
+        yield conn
+
+def get_read_db():
+    """
+    FastAPI dependency: borrow a read-only connection for the duration of a request.
+    """
+    pool = init_pool()
+    with pool.read_connection() as conn:
+        yield conn
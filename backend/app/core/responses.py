@@ -0,0 +1,45 @@
+import orjson
+from fastapi.responses import JSONResponse
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional: without pyarrow, clients get JSON
+    pa = None
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson.
+    For endpoints that return raw rows directly (bypassing response_model),
+    where the stdlib json encoder is the bottleneck.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+def wants_arrow(accept) -> bool:
+    """
+    True if the client asked for an Arrow IPC stream (Accept header) and we can produce one.
+    """
+    return pa is not None and accept is not None and ARROW_STREAM_MEDIA_TYPE in accept
+
+def render_arrow_stream(columns, rows, types=None) -> bytes:
+    """
+    Raw row tuples as an Arrow IPC stream: one columnar record batch, which the client
+    loads without parsing JSON or boxing every value into a Python object.
+    Column types are fixed, not inferred from the values, so a column that is all NULL
+    on a page (or an empty page) keeps its type: `types` maps column name to an Arrow
+    type alias ("int64", "float64", ...), columns not listed are strings.
+    """
+    types = types or {}
+    schema = pa.schema([(name, pa.type_for_alias(types.get(name, "string"))) for name in columns])
+    if rows:
+        arrays = [pa.array(values, type=field.type) for field, values in zip(schema, zip(*rows))]
+    else:
+        arrays = [pa.array([], type=field.type) for field in schema]
+    table = pa.Table.from_arrays(arrays, schema=schema)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -1,9 +1,28 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from app.api.api import api_router
+from app.core.pool import init_pool, close_pool
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the DB connection pool once and close it on shutdown
+    init_pool()
+    # Large CSV imports are parsed in worker processes so pandas doesn't hold the GIL
+    # for the API. 'spawn' because SQLite connections must not be inherited across fork.
+    app.state.import_pool = ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+    yield
+    app.state.import_pool.shutdown(wait=True)
+    close_pool()
 
 # Setup app
-app = FastAPI(title="Expensior API")
+app = FastAPI(title="Expensior API", lifespan=lifespan)
 
 app.include_router(api_router, prefix="/api")
 
@@ -11,6 +11,15 @@ class CategoryCreate(CategoryBase):
 class CategoryUpdate(CategoryBase):
     pass
 
+class CategoryRename(CategoryUpdate):
+    category_id: int
+
+# One save of the Categories editor: applied as deletes, then renames, then creates
+class CategoryBulkChanges(BaseModel):
+    create: List[CategoryCreate] = []
+    update: List[CategoryRename] = []
+    delete: List[int] = []
+
 class SubCategory(CategoryBase):
     category_id: int
     parent_id: int
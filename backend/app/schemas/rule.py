@@ -18,6 +18,10 @@ class RuleCreate(RuleBase):
 class RuleUpdate(RuleBase):
     pass
 
+class RuleBulkItem(RuleBase):
+    # Set: update that rule; missing: create a new one
+    id: Optional[int] = None
+
 class Rule(RuleBase):
     id: int
     category_id: Optional[int] = None
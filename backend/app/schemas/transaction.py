@@ -30,6 +30,10 @@ class TransactionUpdate(BaseModel):
     subcategory: Optional[str] = None
     merchant: Optional[str] = None
 
+# One entry of a bulk manual categorization
+class TransactionCategorizeItem(TransactionUpdate):
+    transaction_id: str
+
 class TransactionCreate(BaseModel):
     date: date
     amount: float
@@ -4,6 +4,56 @@ import sqlite3
 import os
 from typing import Optional
 
+# Scalar subquery resolving category_id from the :category / :subcategory names.
+# Prefers the exact child match, falls back to the main category, NULL if neither exists.
+# Embed it in INSERT/UPDATE statements so the lookup costs no extra round-trip.
+CATEGORY_ID_LOOKUP = """(
+    SELECT c.category_id
+    FROM categories c
+    LEFT JOIN categories p ON c.parent_id = p.category_id
+    WHERE (c.category = :subcategory AND p.category = :category)
+       OR (c.category = :category AND c.parent_id IS NULL)
+    ORDER BY c.parent_id IS NULL
+    LIMIT 1
+)"""
+
+# Process-wide copy of the category table for resolving names in Python.
+# Tagged with meta.categories_version (bumped by triggers on every change),
+# so a stale copy is detected even when another process edited the categories.
+_category_ids = {"version": None, "ids": {}}
+
+def load_category_ids(conn: sqlite3.Connection) -> dict:
+    """
+    Map of (category, subcategory) -> category_id; main categories are keyed (category, None).
+    Costs a single-row version check unless the categories changed since the last call.
+    """
+    version = conn.execute("SELECT value FROM meta WHERE key = 'categories_version'").fetchone()[0]
+    if _category_ids["version"] != version:
+        ids = {}
+        cursor = conn.execute("""
+            SELECT c.category_id, c.category, p.category
+            FROM categories c
+            LEFT JOIN categories p ON c.parent_id = p.category_id
+        """)
+        for cid, name, parent_name in cursor:
+            if parent_name is None:
+                ids[(name, None)] = cid
+            else:
+                ids[(parent_name, name)] = cid
+        _category_ids.update(version=version, ids=ids)
+    return _category_ids["ids"]
+
+def resolve_category_id(category_ids: dict, category: Optional[str], subcategory: Optional[str]) -> Optional[int]:
+    """
+    Same rule as CATEGORY_ID_LOOKUP: exact child match first, then the main category.
+    """
+    if not category:
+        return None
+    cid = category_ids.get((category, subcategory))
+    if cid is None:
+        cid = category_ids.get((category, None))
+    return cid
+
 def load_categories_from_csv(conn: sqlite3.Connection, csv_path: str, clear_existing: bool = False):
     """
     Load categories from CSV file into the categories table.
@@ -23,6 +73,9 @@ def load_categories_from_csv(conn: sqlite3.Connection, csv_path: str, clear_exis
             # Key: Category Name, Value: ID
             parent_cache = {}
 
+            # (subcategory, parent_id) pairs, inserted in one go after the loop
+            child_rows = []
+
             # Pre-load existing parents if not clearing
             if not clear_existing:
                 cursor = conn.execute("SELECT category, category_id FROM categories WHERE parent_id IS NULL")
@@ -55,12 +108,10 @@ def load_categories_from_csv(conn: sqlite3.Connection, csv_path: str, clear_exis
                 
                 # 2. Handle Subcategory
                 if subcategory:
-                    # Insert child linked to parent
-                    try:
-                        conn.execute("INSERT INTO categories (category, parent_id) VALUES (?, ?)", (subcategory, parent_id))
-                    except sqlite3.IntegrityError:
-                        # Already exists, skip
-                        pass
+                    child_rows.append((subcategory, parent_id))
+
+        # Insert children linked to their parents; UNIQUE(category, parent_id) skips existing ones
+        conn.executemany("INSERT OR IGNORE INTO categories (category, parent_id) VALUES (?, ?)", child_rows)
         
         conn.commit()
         print(f"Categories imported successfully from {csv_path}")
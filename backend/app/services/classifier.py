@@ -1,12 +1,32 @@
 import json
 import re
 import sqlite3
+from functools import lru_cache
 import pandas as pd
 
+from app.core.database import bump_version
+
 # -------------------------
 # Conditions Engine
 # -------------------------
 
+# Conditions holding a list of accepted values / substrings
+IN_CONDITION_COLUMNS = ["transaction_type", "country", "city", "currency"]
+TEXT_CONDITION_KEYS = ["not_contains", "must_contain_any", "must_contain_all"]
+
+def normalize_conditions(conditions):
+    """
+    List-valued conditions given as a single value become one-item lists
+    ({"currency": "PLN"} -> {"currency": ["PLN"]}), so apply_conditions, row_conditions_hold
+    and rule_prefilter all read them the same way (not as a substring / set of characters).
+    """
+    if not isinstance(conditions, dict):
+        return conditions
+    return {
+        key: [value] if key in IN_CONDITION_COLUMNS + TEXT_CONDITION_KEYS and not isinstance(value, list) else value
+        for key, value in conditions.items()
+    }
+
 def apply_conditions(mask, dft, conditions):
     """
     Apply additional conditions to narrow down the mask.
@@ -40,7 +60,7 @@ def apply_conditions(mask, dft, conditions):
         mask &= dft["date"] <= pd.to_datetime(conditions["effective_to"])
 
     # --- simple IN conditions ---
-    for col in ["transaction_type", "country", "city", "currency"]:
+    for col in IN_CONDITION_COLUMNS:
         if col in conditions and col in dft.columns:
             mask &= dft[col].isin(conditions[col])
 
@@ -64,74 +84,380 @@ def apply_conditions(mask, dft, conditions):
     return mask
 
 
+def rule_prefilter(dfr: pd.DataFrame):
+    """
+    SQL predicates on amount / date / currency that every rule requires, as (sql, params).
+    A transaction failing them can't match any rule, so it doesn't need to be loaded at all.
+    The bounds are loose on purpose (apply_conditions still checks each rule exactly);
+    ("", []) when some rule has no such condition.
+    """
+    bounds = []
+    for raw in dfr["conditions"].tolist() if "conditions" in dfr.columns else []:
+        ok, conditions = parse_conditions({"conditions": raw})
+        if not ok:
+            continue  # apply_rules skips this rule, it can't match anything
+        conditions = conditions or {}
+
+        lows, highs = [], []
+        if "min_amount" in conditions:
+            lows.append(conditions["min_amount"])
+        if "max_amount" in conditions:
+            highs.append(conditions["max_amount"])
+        if "amount_range" in conditions:
+            lo, hi = conditions["amount_range"]
+            lows.append(lo)
+            highs.append(hi)
+        if conditions.get("amount_sign") == "positive":
+            lows.append(0)
+        elif conditions.get("amount_sign") == "negative":
+            highs.append(0)
+
+        try:
+            date_from = pd.Timestamp(conditions["effective_from"]).normalize() if "effective_from" in conditions else None
+            date_to = pd.Timestamp(conditions["effective_to"]).normalize() if "effective_to" in conditions else None
+        except (TypeError, ValueError):
+            date_from = date_to = None
+
+        bounds.append({
+            "amount_lo": max(lows) if lows else None,
+            "amount_hi": min(highs) if highs else None,
+            "date_from": date_from,
+            "date_to": date_to,
+            "currency": set(conditions["currency"]) if "currency" in conditions else None,
+        })
+
+    if not bounds:
+        return "", []
+
+    def widest(key, pick):
+        values = [b[key] for b in bounds]
+        return None if any(v is None for v in values) else pick(values)
+
+    clauses, params = [], []
+    amount_lo = widest("amount_lo", min)
+    if amount_lo is not None:
+        clauses.append("t.amount >= ?")
+        params.append(amount_lo)
+    amount_hi = widest("amount_hi", max)
+    if amount_hi is not None:
+        clauses.append("t.amount <= ?")
+        params.append(amount_hi)
+    # Dates are ISO strings in the DB: compare by day, with an exclusive next-day upper
+    # bound so times on the last day stay in
+    date_from = widest("date_from", min)
+    if date_from is not None:
+        clauses.append("t.date >= ?")
+        params.append(date_from.strftime("%Y-%m-%d"))
+    date_to = widest("date_to", max)
+    if date_to is not None:
+        clauses.append("t.date < ?")
+        params.append((date_to + pd.Timedelta(days=1)).strftime("%Y-%m-%d"))
+    currencies = widest("currency", lambda sets: set().union(*sets))
+    if currencies is not None:
+        currencies = sorted(currencies)
+        clauses.append(f"t.currency IN ({', '.join('?' * len(currencies))})")
+        params.extend(currencies)
+
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+
 # -------------------------
 # Rules Engine
 # -------------------------
 
-def apply_rules(dft: pd.DataFrame, dfr: pd.DataFrame) -> pd.DataFrame:
+@lru_cache(maxsize=1024)
+def compile_pattern(pattern: str):
     """
-    Apply classification rules to transactions DataFrame.
-    Rules are applied in priority order (highest first).
-    Once a transaction is matched, it's not re-matched by lower priority rules.
+    Case-insensitive compiled regex for a 'regex' rule, or None if it doesn't compile.
+    Cached per process, so repeated classification runs don't recompile the rules.
     """
-    # --- ensure output columns exist ---
-    for col in ["merchant", "category", "subcategory", "rule_id"]:
-        if col not in dft.columns:
-            dft[col] = None
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error:
+        return None
 
-    # --- ensure datetime ---
-    dft["date"] = pd.to_datetime(dft["date"], errors="coerce")
+def parse_conditions(rule: dict):
+    """
+    (ok, conditions) for a rule; ok is False when its JSON is broken (the rule is skipped).
+    Both matchers go through here, so they see the same (normalized) conditions.
+    """
+    raw_conditions = rule.get("conditions")
+    if isinstance(raw_conditions, str) and raw_conditions.strip():
+        try:
+            return True, normalize_conditions(json.loads(raw_conditions))
+        except json.JSONDecodeError:
+            return False, None
+    return True, None
+
+
+def _missing(value) -> bool:
+    return value is None or (isinstance(value, float) and value != value) or value is pd.NaT
+
+
+def _contains(value, pattern) -> bool:
+    # str.contains(case=False, na=False): non-strings never match
+    return isinstance(value, str) and re.search(pattern, value, re.IGNORECASE) is not None
+
+
+def row_conditions_hold(row: dict, conditions) -> bool:
+    """
+    Row-at-a-time twin of apply_conditions, with the same semantics.
+    """
+    if not conditions:
+        return True
+
+    # --- amount (NaN compares False, like in pandas) ---
+    amount = row.get("amount")
+    if any(key in conditions for key in ("min_amount", "max_amount", "amount_range", "amount_sign")):
+        if _missing(amount):
+            if any(key in conditions for key in ("min_amount", "max_amount", "amount_range")):
+                return False
+            if conditions.get("amount_sign") in ("negative", "positive"):
+                return False
+        else:
+            if "min_amount" in conditions and not amount >= conditions["min_amount"]:
+                return False
+            if "max_amount" in conditions and not amount <= conditions["max_amount"]:
+                return False
+            if "amount_range" in conditions:
+                lo, hi = conditions["amount_range"]
+                if not lo <= amount <= hi:
+                    return False
+            if conditions.get("amount_sign") == "negative" and not amount < 0:
+                return False
+            if conditions.get("amount_sign") == "positive" and not amount > 0:
+                return False
+
+    # --- date (apply_rules has already converted it; NaT compares False) ---
+    if "effective_from" in conditions and not row["date"] >= pd.to_datetime(conditions["effective_from"]):
+        return False
+    if "effective_to" in conditions and not row["date"] <= pd.to_datetime(conditions["effective_to"]):
+        return False
+
+    # --- simple IN conditions (isin treats None / NaN as equal) ---
+    for col in IN_CONDITION_COLUMNS:
+        if col in conditions and col in row:
+            value = row[col]
+            if _missing(value):
+                if not any(_missing(v) for v in conditions[col]):
+                    return False
+            elif value not in conditions[col]:
+                return False
+
+    # --- text conditions ---
+    description = row.get("description")
+    if "not_contains" in conditions:
+        if any(_contains(description, val) for val in conditions["not_contains"]):
+            return False
+    if "must_contain_any" in conditions:
+        if not any(_contains(description, val) for val in conditions["must_contain_any"]):
+            return False
+    if "must_contain_all" in conditions:
+        if not all(_contains(description, val) for val in conditions["must_contain_all"]):
+            return False
+
+    return True
+
+
+# Up to this many transactions, match_rows beats match_columns: each pandas call has
+# a fixed cost (~0.5 ms) that dominates when a chunk is small (a monthly statement)
+ROW_MATCH_MAX_ROWS = 5_000
+
+def match_rows(dft: pd.DataFrame, rules: list) -> list:
+    """
+    Plain-Python matcher for small chunks: same result as match_columns,
+    without a pandas call per rule.
+    """
+    columns = {col: dft[col].tolist() for col in dft.columns}
+    records = None  # built on first use, only rules with conditions need whole rows
+    lowered = {}
+
+    unassigned = [i for i, rule_id in enumerate(dft["rule_id"].isna().tolist()) if rule_id]
+    winner = [-1] * len(dft)
+
+    for pos, rule in enumerate(rules):
+        if not unassigned:
+            break
+
+        src_col = rule["source_column"]
+        if src_col not in columns:
+            continue
+
+        # --- base pattern match ---
+        if rule["match_type"] == "contains":
+            if src_col not in lowered:
+                lowered[src_col] = [v.lower() if isinstance(v, str) else None for v in columns[src_col]]
+            values = lowered[src_col]
+            needle = str(rule["pattern"]).lower()
+            hits = [i for i in unassigned if values[i] is not None and needle in values[i]]
+        elif rule["match_type"] == "regex":
+            regex = compile_pattern(str(rule["pattern"]))
+            if regex is None:
+                continue
+            values = columns[src_col]
+            hits = [i for i in unassigned if isinstance(values[i], str) and regex.search(values[i])]
+        else:
+            continue
+        if not hits:
+            continue
+
+        # --- parse and apply conditions ---
+        ok, conditions = parse_conditions(rule)
+        if not ok:
+            continue
+        if conditions:
+            if records is None:
+                records = dft.to_dict("records")
+            hits = [i for i in hits if row_conditions_hold(records[i], conditions)]
+            if not hits:
+                continue
+
+        for i in hits:
+            winner[i] = pos
+        taken = set(hits)
+        unassigned = [i for i in unassigned if i not in taken]
+
+    return winner
 
-    # --- sort rules by priority ---
-    dfr = dfr.sort_values("priority", ascending=False)
 
-    # --- iterate rules ---
-    for _, rule in dfr.iterrows():
+def matchable_rows(dft: pd.DataFrame, rules: list, lowered: dict) -> pd.Series:
+    """
+    Rows that at least one rule's pattern matches, found in one pass per source column:
+    all 'contains' needles go into a single alternation, which re scans for every
+    needle at once instead of one substring scan per rule.
+    Conditions aren't checked here, so this is a superset of what will be assigned.
+    """
+    needles = {}
+    regexes = []
+    for rule in rules:
+        src_col = rule["source_column"]
+        if src_col not in dft.columns:
+            continue
+        if rule["match_type"] == "contains":
+            needles.setdefault(src_col, set()).add(str(rule["pattern"]).lower())
+        elif rule["match_type"] == "regex":
+            regex = compile_pattern(str(rule["pattern"]))
+            if regex is not None:
+                regexes.append((src_col, regex))
+
+    matchable = pd.Series(False, index=dft.index)
+    for src_col, column_needles in needles.items():
+        if src_col not in lowered:
+            lowered[src_col] = dft[src_col].str.lower()
+        combined = re.compile("|".join(re.escape(n) for n in sorted(column_needles, key=len, reverse=True)))
+        matchable |= lowered[src_col].str.contains(combined, na=False)
+    # Regex rules are checked one by one (combining them could renumber backreferences),
+    # and only against rows no needle matched
+    for src_col, regex in regexes:
+        rest = ~matchable
+        if not rest.any():
+            break
+        matchable[rest] = dft.loc[rest, src_col].str.contains(regex, na=False).to_numpy(dtype=bool)
+    return matchable
+
+
+def match_columns(dft: pd.DataFrame, rules: list) -> pd.Series:
+    """
+    Vectorized matcher: one pandas scan per rule over the rows still unassigned.
+    Returns, per transaction, the position in `rules` of the first rule that matched (-1 = none).
+    """
+    # Lowercased copy of each source column, built once and shared by all 'contains' rules,
+    # so each rule is a plain substring scan (no per-rule case folding / regex engine)
+    lowered = {}
+
+    # Rows still waiting for a rule; each rule only scans these. Rows no pattern can match
+    # are dropped up front, so the low-priority tail doesn't rescan them rule after rule.
+    # winner holds the position (in rules) of the rule that matched first, -1 = none yet.
+    unassigned = dft["rule_id"].isna() & matchable_rows(dft, rules, lowered)
+    winner = pd.Series(-1, index=dft.index)
+
+    for pos, rule in enumerate(rules):
+        if not unassigned.any():
+            break
+
         src_col = rule["source_column"]
         if src_col not in dft.columns:
             continue
 
         # --- base pattern match ---
         if rule["match_type"] == "contains":
-            mask = dft[src_col].str.contains(
-                re.escape(str(rule["pattern"])),
-                case=False,
+            if src_col not in lowered:
+                lowered[src_col] = dft[src_col].str.lower()
+            hits = lowered[src_col][unassigned].str.contains(
+                str(rule["pattern"]).lower(),
+                regex=False,
                 na=False
             )
         elif rule["match_type"] == "regex":
-            try:
-                mask = dft[src_col].str.contains(
-                    rule["pattern"],
-                    case=False,
-                    na=False,
-                    regex=True
-                )
-            except re.error:
+            regex = compile_pattern(str(rule["pattern"]))
+            if regex is None:
                 continue
+            hits = dft.loc[unassigned, src_col].str.contains(regex, na=False)
         else:
             continue
+        # hits only covers unassigned rows, so whatever survives is ours to take
+        hits = hits[hits.to_numpy(dtype=bool)]
+        if hits.empty:
+            continue
 
         # --- parse conditions safely ---
-        conditions = None
-        raw_conditions = rule.get("conditions")
-        if isinstance(raw_conditions, str) and raw_conditions.strip():
-            try:
-                conditions = json.loads(raw_conditions)
-            except json.JSONDecodeError:
+        ok, conditions = parse_conditions(rule)
+        if not ok:
+            continue
+
+        # --- apply conditions (to the pattern hits only, not the whole frame) ---
+        if conditions:
+            candidates = dft.loc[hits.index]
+            keep = apply_conditions(pd.Series(True, index=candidates.index), candidates, conditions)
+            hits = hits[keep.to_numpy(dtype=bool)]
+            if hits.empty:
                 continue
 
-        # --- apply conditions ---
-        mask = apply_conditions(mask, dft, conditions)
+        winner[hits.index] = pos
+        unassigned[hits.index] = False
 
-        # --- apply only where not yet classified ---
-        assign_mask = mask & dft["rule_id"].isna()
-        if not assign_mask.any():
-            continue
+    return winner
+
+
+def apply_rules(dft: pd.DataFrame, dfr: pd.DataFrame) -> pd.DataFrame:
+    """
+    Apply classification rules to transactions DataFrame.
+    Rules are applied in priority order (highest first).
+    Once a transaction is matched, it's not re-matched by lower priority rules.
+    """
+    # --- ensure output columns exist ---
+    # Text stays object (None / NaN bind straight to SQL NULL); rule_id is a nullable
+    # integer column, so it doesn't degrade to object / float on the way to the DB
+    for col in ["merchant", "category", "subcategory"]:
+        if col not in dft.columns:
+            dft[col] = None
+    if "rule_id" not in dft.columns:
+        dft["rule_id"] = pd.Series(pd.NA, index=dft.index, dtype="Int64")
 
-        dft.loc[assign_mask, "merchant"] = rule["merchant"]
-        dft.loc[assign_mask, "category"] = rule["category"]
-        dft.loc[assign_mask, "subcategory"] = rule["subcategory"]
-        dft.loc[assign_mask, "rule_id"] = rule["id"]
+    # --- ensure datetime (only needed for effective_from / effective_to) ---
+    # Dates come from SQLite as ISO strings: the ISO8601 fast path skips format inference
+    if any(isinstance(c, str) and "effective_" in c for c in dfr["conditions"].tolist()):
+        dft["date"] = pd.to_datetime(dft["date"], format="ISO8601", errors="coerce")
+
+    # --- sort rules by priority ---
+    dfr = dfr.sort_values("priority", ascending=False).reset_index(drop=True)
+    # Plain dicts: iterrows would build (and box every cell into) a Series per rule
+    rules = dfr.to_dict("records")
+
+    # --- find the first matching rule for every transaction ---
+    if len(dft) <= ROW_MATCH_MAX_ROWS:
+        winner = pd.Series(match_rows(dft, rules), index=dft.index)
+    else:
+        winner = match_columns(dft, rules)
+
+    # --- write all matches at once ---
+    matched = winner >= 0
+    if matched.any():
+        picked = dfr.loc[winner[matched]]
+        dft.loc[matched, "merchant"] = picked["merchant"].to_numpy()
+        dft.loc[matched, "category"] = picked["category"].to_numpy()
+        dft.loc[matched, "subcategory"] = picked["subcategory"].to_numpy()
+        dft.loc[matched, "rule_id"] = picked["id"].to_numpy()
 
     return dft
 
@@ -140,28 +466,56 @@ def apply_rules(dft: pd.DataFrame, dfr: pd.DataFrame) -> pd.DataFrame:
 # DB Operations
 # -------------------------
 
-def load_unclassified_transactions(conn: sqlite3.Connection) -> pd.DataFrame:
-    """
-    Load transactions that don't have a current classification.
+# Transactions are classified in chunks of this many rows, so memory stays bounded
+# no matter how much unclassified history there is
+CLASSIFY_CHUNK_SIZE = 50_000
+
+UNCLASSIFIED_TRANSACTIONS = """
+SELECT 
+    t.transaction_id,
+    t.date,
+    t.transaction_type,
+    t.amount,
+    t.currency,
+    t.description,
+    t.country,
+    t.city
+FROM transactions t
+LEFT JOIN transaction_classifications tc 
+    ON t.transaction_id = tc.transaction_id 
+    AND tc.is_current = 1
+WHERE tc.classification_id IS NULL
+"""
+
+def load_unclassified_transactions(conn: sqlite3.Connection, chunksize: int = CLASSIFY_CHUNK_SIZE,
+                                   where: str = "", where_params=()):
     """
-    query = """
-    SELECT 
-        t.transaction_id,
-        t.date,
-        t.transaction_type,
-        t.amount,
-        t.currency,
-        t.description,
-        t.country,
-        t.city
-    FROM transactions t
-    LEFT JOIN transaction_classifications tc 
-        ON t.transaction_id = tc.transaction_id 
-        AND tc.is_current = 1
-    WHERE tc.classification_id IS NULL
-    ORDER BY t.date DESC
+    Yield transactions that don't have a current classification, newest first,
+    as DataFrames of up to `chunksize` rows.
+    Each chunk is its own keyset query (no open cursor between chunks),
+    so the caller can save classifications in between.
+    `where` / `where_params` narrow the query further (see rule_prefilter).
     """
-    return pd.read_sql_query(query, conn)
+    order = "ORDER BY t.date DESC, t.transaction_id DESC LIMIT ?"
+    after = None
+    while True:
+        if after is None:
+            df = pd.read_sql_query(
+                f"{UNCLASSIFIED_TRANSACTIONS}{where} {order}",
+                conn, params=(*where_params, chunksize)
+            )
+        else:
+            df = pd.read_sql_query(
+                f"{UNCLASSIFIED_TRANSACTIONS}{where} AND (t.date, t.transaction_id) < (?, ?) {order}",
+                conn, params=(*where_params, *after, chunksize)
+            )
+        if df.empty:
+            return
+        # Take the cursor before handing the chunk out (apply_rules may convert dates in place)
+        after = (df["date"].iloc[-1], df["transaction_id"].iloc[-1])
+        yield df
+        if len(df) < chunksize:
+            return
 
 
 def load_rules(conn: sqlite3.Connection) -> pd.DataFrame:
@@ -191,36 +545,33 @@ def save_classifications(conn: sqlite3.Connection, df: pd.DataFrame) -> dict:
     Save classifications to transaction_classifications table.
     Returns stats about what was saved.
     """
-    classified = df[df["rule_id"].notna()].copy()
-    
-    if len(classified) == 0:
-        return {"classified": 0, "unclassified": len(df)}
-    
-    # Filter out rows where category is None/null (required field in DB)
-    classified = classified[classified["category"].notna()]
-    
-    if len(classified) == 0:
+    # Rule hit with a category (required field in DB); a mask, not a filtered copy of the frame
+    mask = df["rule_id"].notna().to_numpy() & df["category"].notna().to_numpy()
+    n = int(mask.sum())
+
+    if n == 0:
         return {"classified": 0, "unclassified": len(df)}
-    
-    rows = []
-    for _, row in classified.iterrows():
-         # handle category_id: it might be NaN/float because of pandas merge, convert to int or None
-         cid = row.get("category_id")
-         if pd.isna(cid):
-             cid = None
-         else:
-             cid = int(cid)
-
-         rows.append((
-            row["transaction_id"],
-            row["category"],
-            row["subcategory"],
-            row["merchant"],
-            "rule",  # method
-            int(row["rule_id"]),
-            cid,     # category_id
-            1,  # is_current
-        ))
+
+    def column(name):
+        return df[name].to_numpy()[mask].tolist()
+
+    # category_id is a NaN-able float after the pandas merge: convert to int or None
+    if "category_id" in df.columns:
+        category_ids = [None if pd.isna(cid) else int(cid) for cid in column("category_id")]
+    else:
+        category_ids = [None] * n
+
+    # Build the parameter tuples column-wise in one pass (no per-row Series objects)
+    rows = list(zip(
+        column("transaction_id"),
+        column("category"),
+        column("subcategory"),
+        column("merchant"),
+        ["rule"] * n,  # method
+        df["rule_id"][mask].to_numpy(dtype="int64").tolist(),
+        category_ids,
+        [1] * n,  # is_current
+    ))
 
     sql = """
     INSERT INTO transaction_classifications 
@@ -231,41 +582,74 @@ def save_classifications(conn: sqlite3.Connection, df: pd.DataFrame) -> dict:
     conn.executemany(sql, rows)
     
     return {
-        "classified": len(classified),
-        "unclassified": len(df) - len(classified)
+        "classified": n,
+        "unclassified": len(df) - n
     }
 
 def run_classification(conn: sqlite3.Connection, dry_run: bool = False):
     """
-    Main entry point for classification service
+    Main entry point for classification service.
+    Works through the unclassified transactions chunk by chunk, in one write transaction.
     """
-    df_transactions = load_unclassified_transactions(conn)
-    
-    if len(df_transactions) == 0:
-        return {"status": "no_transactions"}
-    
     df_rules = load_rules(conn)
-    df_classified = apply_rules(df_transactions, df_rules)
-    
-    classified_count = df_classified["rule_id"].notna().sum()
-    unclassified_count = df_classified["rule_id"].isna().sum()
-    
+    where, where_params = rule_prefilter(df_rules)
+
+    found = 0
+    classified_count = 0
+    saved = {"classified": 0}
+    sample = []
+
+    if not dry_run:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        if where:
+            # Rows the prefilter leaves in the DB still count as found (and unclassified)
+            total = conn.execute(f"SELECT COUNT(*) FROM ({UNCLASSIFIED_TRANSACTIONS})").fetchone()[0]
+            loaded = conn.execute(
+                f"SELECT COUNT(*) FROM ({UNCLASSIFIED_TRANSACTIONS}{where})", where_params
+            ).fetchone()[0]
+            found = total - loaded
+        for df_transactions in load_unclassified_transactions(conn, where=where, where_params=where_params):
+            df_classified = apply_rules(df_transactions, df_rules)
+            matched = df_classified["rule_id"].notna()
+            found += len(df_classified)
+            classified_count += int(matched.sum())
+
+            if dry_run:
+                if len(sample) < 10:
+                    sample += df_classified[matched][
+                            ["transaction_id", "description", "category", "subcategory", "merchant", "rule_id"]
+                        ].head(10 - len(sample)).to_dict(orient="records")
+            elif matched.any():
+                stats = save_classifications(conn, df_classified)
+                saved["classified"] += stats["classified"]
+
+        if not dry_run:
+            if classified_count > 0:
+                bump_version(conn, 'transactions_version')
+            conn.commit()
+    except Exception:
+        if not dry_run:
+            conn.rollback()
+        raise
+
+    if found == 0:
+        return {"status": "no_transactions"}
+
     result = {
-        "found": len(df_transactions),
-        "classified": int(classified_count),
-        "unclassified": int(unclassified_count),
+        "found": found,
+        "classified": classified_count,
+        "unclassified": found - classified_count,
     }
 
     if dry_run:
-        result["dry_run_sample"] = df_classified[df_classified["rule_id"].notna()][
-                ["transaction_id", "description", "category", "subcategory", "merchant", "rule_id"]
-            ].head(10).to_dict(orient="records")
+        result["dry_run_sample"] = sample
         return result
     
     if classified_count > 0:
-        conn.execute('BEGIN')
-        stats = save_classifications(conn, df_classified)
-        conn.commit()
-        result["saved"] = stats
+        # Over everything found, so rows the prefilter skipped and chunks without
+        # a match are counted the same way as in the top-level numbers
+        saved["unclassified"] = found - saved["classified"]
+        result["saved"] = saved
     
     return result
@@ -4,6 +4,8 @@ from datetime import datetime, timezone
 import pandas as pd
 import os
 
+from app.core.database import bump_version, get_db_connection
+
 # -------------------------
 # Helpers
 # -------------------------
@@ -377,9 +379,11 @@ def import_file(file_path: str, conn: sqlite3.Connection, on_conflict: str = 'ig
             "preview": df_std.head(5).to_dict()
         }
 
+    # The connection may be a pooled one: put foreign_keys back the way we found it
+    foreign_keys = conn.execute('PRAGMA foreign_keys').fetchone()[0]
     try:
         conn.execute('PRAGMA foreign_keys = ON')
-        conn.execute('BEGIN')
+        conn.execute('BEGIN IMMEDIATE')
 
         # Guard: batch exists
         if conn.execute("SELECT 1 FROM import_batches WHERE import_batch_id=?", (batch_id,)).fetchone():
@@ -387,6 +391,7 @@ def import_file(file_path: str, conn: sqlite3.Connection, on_conflict: str = 'ig
 
         insert_import_batch(conn, batch_id, source_file, len(df_std), status='ok')
         stats = insert_transactions(conn, df_std, batch_id, on_conflict=on_conflict)
+        bump_version(conn, 'transactions_version')
         conn.commit()
         
         return {
@@ -403,3 +408,17 @@ def import_file(file_path: str, conn: sqlite3.Connection, on_conflict: str = 'ig
         except:
             pass
         raise e
+    finally:
+        conn.execute(f'PRAGMA foreign_keys = {foreign_keys}')
+
+
+def import_file_standalone(file_path: str, on_conflict: str = 'ignore'):
+    """
+    Same as import_file, but opens (and closes) its own connection.
+    Used when the import runs in a separate worker process.
+    """
+    conn = get_db_connection()
+    try:
+        return import_file(file_path, conn, on_conflict=on_conflict)
+    finally:
+        conn.close()
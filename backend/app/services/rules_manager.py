@@ -2,6 +2,8 @@ import csv
 import sqlite3
 import os
 
+from app.services.categories_manager import load_category_ids, resolve_category_id
+
 def load_rules_from_csv(conn: sqlite3.Connection, csv_path: str, clear_existing: bool = False):
     """
     Load rules from CSV file into the rules table.
@@ -21,9 +23,12 @@ def load_rules_from_csv(conn: sqlite3.Connection, csv_path: str, clear_existing:
         if clear_existing:
             conn.execute('DELETE FROM rules')
         
+        # Resolve category names in memory instead of 1-2 SELECTs per rule
+        category_ids = load_category_ids(conn)
+
         with open(csv_path, 'r', encoding='utf-8') as f:
             reader = csv.DictReader(f)
-            rows_inserted = 0
+            rows = []
             
             for row in reader:
                 # Skip empty or invalid rows
@@ -42,40 +47,23 @@ def load_rules_from_csv(conn: sqlite3.Connection, csv_path: str, clear_existing:
                 priority_str = row.get('priority', '10').strip()
                 priority = int(priority_str) if priority_str else 10
                 
-                # Resolve category_id
-                category_id = None
-                if category:
-                    # Try exact match first
-                    if subcategory:
-                        cur = conn.execute("""
-                            SELECT c.category_id 
-                            FROM categories c
-                            JOIN categories p ON c.parent_id = p.category_id
-                            WHERE c.category = ? AND p.category = ?
-                        """, (subcategory, category))
-                        res = cur.fetchone()
-                        if res:
-                            category_id = res[0]
-                    
-                    if not category_id:
-                        # Try just parent category
-                        cur = conn.execute("SELECT category_id FROM categories WHERE category = ? AND parent_id IS NULL", (category,))
-                        res = cur.fetchone()
-                        if res:
-                            category_id = res[0]
+                # Resolve category_id (exact subcategory match first, then parent category)
+                category_id = resolve_category_id(category_ids, category, subcategory)
+
+                rows.append((pattern, match_type, source_column, merchant, category, subcategory, category_id, conditions, priority))
 
-                conn.execute(
-                    """
-                    INSERT INTO rules 
-                    (pattern, match_type, source_column, merchant, category, subcategory, category_id, conditions, priority)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (pattern, match_type, source_column, merchant, category, subcategory, category_id, conditions, priority)
-                )
-                rows_inserted += 1
+        # One executemany for the whole file instead of an INSERT per row
+        conn.executemany(
+            """
+            INSERT INTO rules 
+            (pattern, match_type, source_column, merchant, category, subcategory, category_id, conditions, priority)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows
+        )
         
         # conn.commit() # Caller should commit
-        return rows_inserted
+        return len(rows)
         
     except Exception as e:
         # conn.rollback() # Caller should rollback
@@ -0,0 +1,33 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+# Tests import the API the way it runs: with backend/ on the path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.api.endpoints import transactions
+from app.core import database, pool
+from app.core.config import SQL_DIR
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """
+    Fresh database from sql/schema.sql, used by every connection the API opens during the test.
+    """
+    path = tmp_path / "expensior.db"
+    conn = sqlite3.connect(path)
+    conn.executescript((SQL_DIR / "schema.sql").read_text(encoding="utf-8"))
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(database, "DB_PATH", path)
+    pool.close_pool()
+    # Every fresh database starts at the same version, so no page may outlive its test
+    with transactions._page_cache_lock:
+        transactions._page_cache.clear()
+        transactions._page_cache_version = None
+        transactions._page_cache_bytes = 0
+    yield path
+    pool.close_pool()
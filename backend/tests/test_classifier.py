@@ -0,0 +1,104 @@
+import json
+import random
+
+import pandas as pd
+import pytest
+
+from app.services.classifier import ROW_MATCH_MAX_ROWS, match_columns, match_rows, rule_prefilter
+
+WORDS = ["biedronka", "lidl", "zabka", "orlen", "uber", "netflix", "apteka", "shop", "sp. z o.o.", "BLIK"]
+TYPES = ["card_payment", "blik", "transfer", "cash", None]
+CURRENCIES = ["PLN", "EUR", "USD", None]
+PLACES = ["Warszawa", "Krakow", None]
+
+def random_transactions(rng, n):
+    def description():
+        if rng.random() < 0.05:
+            return None
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))).upper() if rng.random() < 0.5 \
+            else " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+    dft = pd.DataFrame({
+        "transaction_id": [f"t{i}" for i in range(n)],
+        "date": pd.to_datetime(
+            [None if rng.random() < 0.02 else f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}" for _ in range(n)],
+            format="ISO8601", errors="coerce"
+        ),
+        "transaction_type": [rng.choice(TYPES) for _ in range(n)],
+        "amount": [float("nan") if rng.random() < 0.02 else round(rng.uniform(-500, 500), 2) for _ in range(n)],
+        "currency": [rng.choice(CURRENCIES) for _ in range(n)],
+        "description": [description() for _ in range(n)],
+        "country": [rng.choice(["PL", "DE", None]) for _ in range(n)],
+        "city": [rng.choice(PLACES) for _ in range(n)],
+    })
+    # Some rows already carry a rule from an earlier pass
+    dft["rule_id"] = pd.array([7 if rng.random() < 0.05 else pd.NA for _ in range(n)], dtype="Int64")
+    return dft
+
+def random_conditions(rng):
+    roll = rng.random()
+    if roll < 0.3:
+        return None
+    if roll < 0.35:
+        return "{not json"
+    conditions = {}
+    for key in rng.sample(["min_amount", "max_amount", "amount_range", "amount_sign", "effective_from",
+                           "effective_to", "transaction_type", "currency", "city", "not_contains",
+                           "must_contain_any", "must_contain_all"], rng.randint(1, 3)):
+        if key in ("min_amount", "max_amount"):
+            conditions[key] = rng.randint(-300, 300)
+        elif key == "amount_range":
+            lo = rng.randint(-400, 200)
+            conditions[key] = [lo, lo + rng.randint(0, 300)]
+        elif key == "amount_sign":
+            conditions[key] = rng.choice(["negative", "positive"])
+        elif key.startswith("effective_"):
+            conditions[key] = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        else:
+            pool = {"transaction_type": TYPES, "currency": CURRENCIES, "city": PLACES}.get(key, WORDS[:8])
+            values = rng.sample(pool, rng.randint(1, 2))
+            # A single value instead of a list must be read the same way by both matchers
+            conditions[key] = values[0] if rng.random() < 0.3 and values[0] is not None else values
+    return json.dumps(conditions)
+
+def random_rules(rng, count):
+    rules = []
+    for rule_id in range(1, count + 1):
+        match_type = rng.choice(["contains", "contains", "regex", "fuzzy"])
+        if match_type == "regex":
+            pattern = rng.choice([r"^lidl", r"orl[ea]n", r"uber|bolt", r"sp\. z", r"(unclosed", r"\d+"])
+        else:
+            pattern = rng.choice(WORDS + ["ZABKA", "a"])
+        rules.append({
+            "id": rule_id,
+            "pattern": pattern,
+            "match_type": match_type,
+            "source_column": rng.choice(["description", "description", "transaction_type", "no_such_column"]),
+            "conditions": random_conditions(rng),
+            "priority": rng.randint(1, 20),
+        })
+    return sorted(rules, key=lambda rule: rule["priority"], reverse=True)
+
+@pytest.mark.parametrize("rows, seeds", [
+    (50, range(40)),
+    (ROW_MATCH_MAX_ROWS + 200, range(3)),
+])
+def test_row_and_column_matchers_agree(rows, seeds):
+    for seed in seeds:
+        rng = random.Random(seed)
+        dft = random_transactions(rng, rows)
+        rules = random_rules(rng, 30)
+        assert match_rows(dft, rules) == match_columns(dft, rules).tolist(), f"seed {seed}"
+
+def test_single_value_in_condition_is_not_a_substring_check():
+    dft = pd.DataFrame({
+        "transaction_id": ["t1", "t2"],
+        "amount": [-10.0, -10.0],
+        "currency": ["PLN", "PL"],
+        "description": ["SHOP", "SHOP"],
+    })
+    dft["rule_id"] = pd.array([pd.NA, pd.NA], dtype="Int64")
+    rules = [{"id": 1, "pattern": "shop", "match_type": "contains", "source_column": "description",
+              "conditions": '{"currency": "PLN"}', "priority": 10}]
+    assert match_rows(dft, rules) == [0, -1]
+    assert match_columns(dft, rules).tolist() == [0, -1]
+    assert rule_prefilter(pd.DataFrame(rules)) == (" AND t.currency IN (?)", ["PLN"])
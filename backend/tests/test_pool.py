@@ -0,0 +1,45 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import anyio.to_thread
+import httpx
+
+from app.core import pool
+from app.main import app
+
+# More concurrent requests than FastAPI's threadpool has tokens (40 by default)
+CONCURRENT_REQUESTS = 64
+
+async def fire(method, url, count, **kwargs):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        responses = await asyncio.gather(*(client.request(method, url, **kwargs) for _ in range(count)))
+        # A request on its own must still go through afterwards
+        after = await client.get("/api/categories/")
+    return [r.status_code for r in responses], after.status_code
+
+def run(coro):
+    # Bounded, so a starved threadpool fails the test instead of hanging it
+    async def bounded():
+        assert anyio.to_thread.current_default_thread_limiter().total_tokens < CONCURRENT_REQUESTS
+        return await asyncio.wait_for(coro, timeout=30)
+    return asyncio.run(bounded())
+
+def test_concurrent_reads_do_not_starve_threadpool(db_path):
+    statuses, after = run(fire("GET", "/api/categories/", CONCURRENT_REQUESTS))
+    assert statuses == [200] * CONCURRENT_REQUESTS
+    assert after == 200
+
+def test_concurrent_writes_do_not_starve_threadpool(db_path):
+    rule = {"pattern": "SHOP", "category": "groceries"}
+    statuses, after = run(fire("POST", "/api/rules/", CONCURRENT_REQUESTS, json=rule))
+    # Writers queue for the single writer connection; any that can't get it in time get a 503
+    assert set(statuses) <= {200, 503}
+    assert 200 in statuses
+    assert after == 200
+
+def test_concurrent_first_use_creates_one_pool(db_path):
+    pool.close_pool()
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        pools = list(executor.map(lambda _: pool.init_pool(), range(64)))
+    assert all(p is pools[0] for p in pools)
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pyarrow as pa
+from fastapi.testclient import TestClient
+
+from app.core.responses import ARROW_STREAM_MEDIA_TYPE
+from app.api.endpoints import transactions
+from app.main import app
+
+def add_transactions(db_path, count):
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO import_batches (import_batch_id) VALUES ('b1')")
+    conn.executemany(
+        "INSERT INTO transactions (transaction_id, date, transaction_type, amount, currency, description, import_batch_id)"
+        " VALUES (?, '2024-01-01', 'card_payment', ?, 'PLN', 'SHOP', 'b1')",
+        [(f"t{i}", -i) for i in range(count)]
+    )
+    conn.commit()
+    conn.close()
+
+def read_arrow(params):
+    with TestClient(app) as client:
+        response = client.get("/api/transactions/", params=params, headers={"Accept": ARROW_STREAM_MEDIA_TYPE})
+    assert response.headers["content-type"].startswith(ARROW_STREAM_MEDIA_TYPE)
+    return pa.ipc.open_stream(response.content).read_all()
+
+def test_arrow_page_keeps_types_of_all_null_columns(db_path):
+    # Nothing classified: category, subcategory, category_id and merchant are all NULL
+    add_transactions(db_path, 3)
+    table = read_arrow({"limit": 10})
+    assert table.num_rows == 3
+    assert table.schema.field("subcategory").type == pa.string()
+    assert table.schema.field("category").type == pa.string()
+    assert table.schema.field("category_id").type == pa.int64()
+    assert table.schema.field("amount").type == pa.float64()
+
+def test_empty_arrow_page_keeps_types(db_path):
+    table = read_arrow({"limit": 10})
+    assert table.num_rows == 0
+    assert table.schema.field("date").type == pa.string()
+    assert table.schema.field("amount").type == pa.float64()
+
+def test_bulk_categorize_rejects_missing_category_without_writing(db_path):
+    add_transactions(db_path, 2)
+    updates = [
+        {"transaction_id": "t0", "category": "food"},
+        {"transaction_id": "t1", "category": None, "merchant": "SHOP"},
+    ]
+    with TestClient(app) as client:
+        response = client.post("/api/transactions/bulk_categorize", json=updates)
+    assert response.status_code == 422
+    assert "t1" in response.json()["detail"]
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM transaction_classifications").fetchone()[0] == 0
+    conn.close()
+
+def test_page_cache_is_bounded_by_bytes(db_path, monkeypatch):
+    add_transactions(db_path, 50)
+    monkeypatch.setattr(transactions, "PAGE_CACHE_MAX_BYTES", 4000)
+    monkeypatch.setattr(transactions, "PAGE_CACHE_MAX_ENTRY_BYTES", 2000)
+    with TestClient(app) as client:
+        sizes = [len(client.get("/api/transactions/", params={"limit": limit}).content) for limit in range(1, 11)]
+        # Too big for one entry: served, but not kept
+        client.get("/api/transactions/", params={"limit": 50})
+
+    cached = [len(body) for body, _, _ in transactions._page_cache.values()]
+    assert transactions._page_cache_bytes == sum(cached) <= 4000
+    assert 0 < len(cached) < len(sizes)
+    # The most recent pages are the ones kept
+    assert cached == [size for size in sizes if size <= 2000][-len(cached):]
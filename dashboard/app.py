@@ -1,12 +1,21 @@
 
 import streamlit as st
 import requests
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import plotly.express as px
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # --- Config ---
 API_URL = "http://127.0.0.1:8000/api"
+HEALTH_URL = API_URL.rsplit('/api', 1)[0] + '/'
 
 st.set_page_config(page_title="Expensior Dashboard", layout="wide")
 
@@ -33,41 +42,289 @@ if "global_date_range" not in st.session_state:
 def refresh_data():
     st.session_state.refresh_key += 1
 
+# --- HTTP Session ---
+@st.cache_resource
+def get_session() -> requests.Session:
+    """
+    One keep-alive session for every API call, shared across reruns and browser sessions
+    (the script reruns on each interaction, so a module-level Session would be rebuilt every time).
+    Idempotent requests are retried briefly if the backend is restarting.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=Retry(total=2, backoff_factor=0.2))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+SESSION = get_session()
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="fetch")
+
+def run_in_background(fn, *args, **kwargs) -> Future:
+    """
+    Start an independent API call on a worker thread while the script carries on.
+    The worker is attached to the current script run, so st.cache_data and st.error
+    inside fn behave as if it were called inline.
+    """
+    ctx = get_script_run_ctx()
+
+    def call():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+
+    return get_executor().submit(call)
+
 # --- API Functions ---
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+def parse_dates(table: pa.Table) -> pa.Table:
+    """
+    Parse the ISO 'date' strings once, in Arrow, so to_pandas() hands every view a
+    datetime64 column (the date filters then compare int64s, no per-view parsing).
+    """
+    idx = table.schema.get_field_index("date")
+    if idx < 0 or not pa.types.is_string(table.schema.field(idx).type):
+        return table
+    return table.set_column(idx, "date", pc.cast(table.column(idx), pa.timestamp("us")))
+
+# Tables kept for ETag revalidation (oldest dropped first)
+TRANSACTIONS_STORE_SIZE = 16
+
+@st.cache_resource
+def get_transactions_store() -> dict:
+    """Last table fetched per query, with its ETag: {(limit, start, end): (etag, table)}."""
+    return {}
+
 @st.cache_data(ttl=60)
-def fetch_transactions(limit=2000, _refresh_key=0):
+def fetch_transactions(limit=2000, start=None, end=None, _refresh_key=0) -> pa.Table:
+    """
+    Latest transactions as an Arrow table (empty on error), optionally only those
+    dated start..end (inclusive; the API filters in SQL).
+    Asks the API for an Arrow IPC stream, so there's no JSON to parse and no
+    per-value Python objects; falls back to JSON if the backend can't send Arrow.
+    The last table is kept with its ETag: once the TTL runs out (or the cache is
+    cleared) it is revalidated, and an unchanged dataset comes back as a 304.
+    """
+    store = get_transactions_store()
+    query = (limit, start, end)
+    params = {"limit": limit}
+    if start is not None:
+        params["start"] = start.isoformat()
+    if end is not None:
+        params["end"] = end.isoformat()
+    headers = {"Accept": f"{ARROW_STREAM}, application/json;q=0.5"}
+    if query in store:
+        headers["If-None-Match"] = store[query][0]
     try:
-        response = requests.get(f"{API_URL}/transactions", params={"limit": limit})
+        response = SESSION.get(f"{API_URL}/transactions/", params=params, headers=headers)
+        if response.status_code == 304:
+            return store[query][1]
         response.raise_for_status()
-        return response.json()
+        if response.headers.get("content-type", "").startswith(ARROW_STREAM):
+            table = pa.ipc.open_stream(response.content).read_all()
+        else:
+            table = pa.Table.from_pylist(orjson.loads(response.content))
+        table = parse_dates(table)
+        if "ETag" in response.headers:
+            store.pop(query, None)
+            store[query] = (response.headers["ETag"], table)
+            if len(store) > TRANSACTIONS_STORE_SIZE:
+                store.pop(next(iter(store)))
+        return table
     except Exception as e:
         st.error(f"Error fetching transactions: {e}")
-        return []
+        return pa.table({})
+
+@st.cache_resource
+def get_categories_store() -> dict:
+    """Last category tree fetched, with its ETag: {"etag": ..., "tree": [...]}."""
+    return {}
 
 @st.cache_data(ttl=60)
 def fetch_categories_tree():
+    """
+    Category tree from the API. The last good tree is kept with its ETag, so an
+    unchanged tree is revalidated with a 304, and a failed request falls back to it
+    (flagged with a warning) instead of leaving the views without categories.
+    """
+    store = get_categories_store()
+    headers = {"If-None-Match": store["etag"]} if "etag" in store else {}
     try:
-        response = requests.get(f"{API_URL}/categories")
-        if response.status_code == 200:
-            return response.json()
+        # Trailing slash: the bare path costs an extra 307 round trip
+        response = SESSION.get(f"{API_URL}/categories/", headers=headers)
+        if response.status_code == 304:
+            return store["tree"]
+        response.raise_for_status()
+        tree = orjson.loads(response.content)
+        if "ETag" in response.headers:
+            store.update(etag=response.headers["ETag"], tree=tree)
+        return tree
     except Exception as e:
+        if "tree" in store:
+            st.warning(f"Error fetching categories, showing the last loaded ones: {e}")
+            return store["tree"]
         st.error(f"Error fetching categories: {e}")
     return []
 
+@st.cache_data(ttl=60)
+def fetch_category_options():
+    """
+    Dropdown lists derived from the category tree, built once per tree fetch
+    instead of on every rerun:
+    - flat: sorted "category" / "category: subcategory" labels
+    - main: main category names (the API already returns them sorted by name)
+    - subs: sorted, de-duplicated subcategory names
+    """
+    cat_tree = fetch_categories_tree()
+    flat = []
+    subs = set()
+    for c in cat_tree:
+        flat.append(c['category'])
+        for s in c.get('subcategories', []):
+            flat.append(f"{c['category']}: {s['category']}")
+            subs.add(s['category'])
+    return {
+        "flat": sorted(flat),
+        "main": [c['category'] for c in cat_tree],
+        "subs": sorted(subs),
+    }
+
+@st.cache_data(ttl=10)
+def backend_is_up() -> bool:
+    """Sidebar healthcheck, at most one request per 10s and never blocking a rerun for long."""
+    try:
+        return SESSION.get(HEALTH_URL, timeout=0.5).ok
+    except requests.RequestException:
+        return False
+
+@st.cache_data(ttl=60)
+def build_category_sunburst():
+    """
+    Sunburst of the category tree for the Categories view, built once per tree fetch
+    instead of on every rerun (renames, expanders, popovers).
+    """
+    cat_tree = fetch_categories_tree()
+
+    # Flatten for Plotly Sunburst
+    # Columns: [id, label, parent]
+    sunburst_data = []
+    
+    # Root node
+    sunburst_data.append({"id": "ROOT", "label": "Expenses", "parent": ""})
+    
+    for main_cat in cat_tree:
+        mid = f"M_{main_cat['category_id']}"
+        sunburst_data.append({
+            "id": mid, 
+            "label": main_cat['category'], 
+            "parent": "ROOT"
+        })
+        
+        for sub in main_cat.get('subcategories', []):
+            sid = f"S_{sub['category_id']}"
+            sunburst_data.append({
+                "id": sid,
+                "label": sub['category'],
+                "parent": mid
+            })
+    
+    df_sun = pd.DataFrame(sunburst_data)
+    fig = px.sunburst(
+        df_sun,
+        names='label',
+        parents='parent',
+        ids='id',
+    )
+    fig.update_layout(margin=dict(t=0, l=0, r=0, b=0))
+    return fig
+
+def clear_categories_cache():
+    fetch_categories_tree.clear()
+    fetch_category_options.clear()
+    build_category_sunburst.clear()
+
+@st.cache_data(ttl=60)
+def load_analytics_frame(limit=5000, start=None, end=None, _refresh_key=0) -> pd.DataFrame:
+    """
+    Transactions prepared for the analytics view, built once per fetch instead of
+    on every widget interaction (empty if there is nothing to show).
+    """
+    raw_data = fetch_transactions(limit=limit, start=start, end=end, _refresh_key=_refresh_key)
+    if raw_data.num_rows == 0:
+        # Typed, so an empty window still renders the view (zero metrics, no charts)
+        return pd.DataFrame({
+            'date': pd.Series(dtype='datetime64[us]'),
+            'amount': pd.Series(dtype='float64'),
+            'category': pd.Series(dtype='category'),
+            'subcategory': pd.Series(dtype='category'),
+            'currency': pd.Series(dtype='category'),
+        })
+
+    df = raw_data.to_pandas()
+    # Low-cardinality labels as categoricals: the ==/isin masks and groupbys in the view work
+    # on small integer codes instead of Python strings. Blanks are labelled once, up front.
+    df['category'] = df['category'].fillna('Other').replace('', 'Other').astype('category')
+    df['subcategory'] = df['subcategory'].fillna('General').replace('', 'General').astype('category')
+    df['currency'] = df['currency'].astype('category')
+    return df
+
+@st.cache_data(ttl=60)
+def load_transactions_frame(limit=5000, _refresh_key=0) -> pd.DataFrame:
+    """
+    Transactions prepared for the Transactions Manager (with category_display),
+    built once per fetch instead of on every edit, filter or checkbox click.
+    """
+    raw_data = fetch_transactions(limit=limit, _refresh_key=_refresh_key)
+    if raw_data.num_rows == 0:
+        return pd.DataFrame()
+
+    df = raw_data.to_pandas()
+    # Display string for category: "category: subcategory", just "category", or missing.
+    # Column-wise, on one string dtype: a column with no values at all comes out of
+    # Arrow/JSON as object None, which pandas won't add to a str column.
+    cat = df['category'].astype('string')
+    sub = df['subcategory'].astype('string')
+    has_sub = sub.notna() & (sub != '')
+    display = cat.where(~has_sub, cat + ': ' + sub)
+    df['category_display'] = display.where(cat.notna() & (cat != ''))
+    return df
+
+def editor_has_changes(key) -> bool:
+    """
+    True if the st.data_editor with this key holds edited, added or deleted rows.
+    Reads the editor's own change log, so an untouched table is detected without
+    comparing it against the original frame.
+    """
+    state = st.session_state.get(key)
+    if not isinstance(state, dict):
+        return True  # No change log to go by: let the caller diff
+    return bool(state.get("edited_rows") or state.get("added_rows") or state.get("deleted_rows"))
+
 # --- Views ---
 
+# A fragment: the period buttons, selector and date picker rerun only this view
+# (not the sidebar, navigation and healthcheck around it)
+@st.fragment
 def view_analytics():
     st.title("📊 Analytics Dashboard")
     
     # --- Load Data ---
-    raw_data = fetch_transactions(limit=5000, _refresh_key=st.session_state.refresh_key)
-    if not raw_data:
+    # Only the selected window is fetched (filtered in SQL on the date index);
+    # until a full range is picked, the latest transactions are loaded instead
+    date_range = st.session_state.global_date_range
+    if isinstance(date_range, tuple) and len(date_range) == 2:
+        window_start, window_end = date_range
+    else:
+        window_start, window_end = None, None
+    df = load_analytics_frame(
+        limit=5000, start=window_start, end=window_end, _refresh_key=st.session_state.refresh_key
+    )
+    if df.empty and window_start is None:
         st.info("No transactions found.")
         return
 
-    df = pd.DataFrame(raw_data)
-    df['date'] = pd.to_datetime(df['date'])
-
     # --- Date Filter & Control Panel ---
     
     # (State initialization moved to global scope to prevent reset on tab change)
@@ -123,7 +380,7 @@ def view_analytics():
         # Update the widget key as well to ensure the UI reflects the change immediately
         if "filter_date_range" in st.session_state:
             st.session_state.filter_date_range = (new_start, new_end)
-        st.rerun()
+        # (runs as the buttons' on_click, so the rerun that follows already sees the new range)
 
     def on_date_change():
         st.session_state.global_date_range = st.session_state.filter_date_range
@@ -140,8 +397,7 @@ def view_analytics():
         
         with c_nav_prev:
             st.markdown("###") # Vertical alignment spacer
-            if st.button("◀", key="btn_prev", help="Previous Period"):
-                adjust_period(-1)
+            st.button("◀", key="btn_prev", help="Previous Period", on_click=adjust_period, args=(-1,))
         
         with c_nav_sel:
             # Period Type Selector
@@ -154,8 +410,7 @@ def view_analytics():
 
         with c_nav_next:
             st.markdown("###") # Vertical alignment spacer
-            if st.button("▶", key="btn_next", help="Next Period"):
-                adjust_period(1)
+            st.button("▶", key="btn_next", help="Next Period", on_click=adjust_period, args=(1,))
 
         with c_picker:
             # Main Date Picker (Source of Truth)
@@ -177,39 +432,38 @@ def view_analytics():
         # Fallback
         start_date, end_date = df['date'].min().date(), df['date'].max().date() 
 
-    # Extract dates for filtering
-    # Handle the case where range isn't fully picked yet
-    if isinstance(st.session_state.filter_date_range, tuple) and len(st.session_state.filter_date_range) == 2:
-        start_date, end_date = st.session_state.filter_date_range
-    else:
-        # Fallback
-        start_date, end_date = df['date'].min().date(), df['date'].max().date()
-
     # Apply Filters
-    mask = (
-        (df['date'].dt.date >= start_date) & 
-        (df['date'].dt.date <= end_date)
-    )
-    df_filtered = df.loc[mask]
+    # Compare datetime64 to Timestamps (no per-row datetime.date objects); the end day is inclusive
+    start_ts = pd.Timestamp(start_date)
+    end_ts = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+    if start_ts <= df['date'].min() and df['date'].max() < end_ts:
+        # Range covers every loaded row: nothing to mask
+        df_filtered = df
+    else:
+        mask = (
+            (df['date'] >= start_ts) & 
+            (df['date'] < end_ts)
+        )
+        df_filtered = df.loc[mask]
 
     # --- Metrics Calculation ---
     
     # Normalize category names for comparison (just in case)
     # But based on DB inspection, they are lowercase 'income' and 'savings'
+    # One pass over amount: per-category sums, then the KPIs are read off them
+    category_sums = df_filtered.groupby('category', observed=True, sort=False)['amount'].sum()
     
     # 1. Income
-    income_mask = df_filtered['category'] == 'income'
-    val_income = df_filtered.loc[income_mask, 'amount'].sum()
+    val_income = category_sums.get('income', 0.0)
     
     # 2. Savings
-    savings_mask = df_filtered['category'] == 'savings'
     # Savings are usually negative (outflow), so we invert sign for display "Amount Saved"
-    val_savings = df_filtered.loc[savings_mask, 'amount'].sum() * -1
+    val_savings = category_sums.get('savings', 0.0) * -1
     
     # 3. Expenses (Everything else)
     # Logic: Sum of ALL transactions that are NOT income and NOT savings.
+    val_expenses_net = category_sums.drop(['income', 'savings'], errors='ignore').sum()
     expenses_mask = ~df_filtered['category'].isin(['income', 'savings'])
-    val_expenses_net = df_filtered.loc[expenses_mask, 'amount'].sum()
     
     # 4. Balance (Income - Expenses)
     # Since val_expenses_net is typically negative (e.g. -2000), we add it: 5000 + (-2000) = 3000
@@ -236,17 +490,16 @@ def view_analytics():
     
     with c1:
         st.subheader("Hierarchy")
-        df_spending = df_filtered[expenses_mask].copy()
+        # Read-only from here on (labels were filled at load), so no defensive copy
+        df_spending = df_filtered[expenses_mask]
         
         if not df_spending.empty:
-            # Fill missing categories with 'Other'
-            df_spending['category'] = df_spending['category'].fillna('Other').replace('', 'Other')
-            df_spending['subcategory'] = df_spending['subcategory'].fillna('General').replace('', 'General')
+            # (missing categories are already 'Other' / 'General', see load_analytics_frame)
             
             # Group by category and subcategory for netting
-            cat_sub_totals = df_spending.groupby(['category', 'subcategory'])['amount'].sum().reset_index()
-            # Convert to absolute magnitude for the hierarchy
-            cat_sub_totals['spending'] = cat_sub_totals['amount'].apply(lambda x: abs(x) if x < 0 else 0)
+            cat_sub_totals = df_spending.groupby(['category', 'subcategory'], observed=True)['amount'].sum().reset_index()
+            # Convert to absolute magnitude for the hierarchy (net outflow, 0 for net inflow)
+            cat_sub_totals['spending'] = (-cat_sub_totals['amount']).clip(lower=0)
             cat_sub_totals = cat_sub_totals[cat_sub_totals['spending'] > 0]
 
             if not cat_sub_totals.empty:
@@ -256,10 +509,10 @@ def view_analytics():
                 sun_data = [{"id": "ROOT", "label": " ", "parent": "", "value": total_spending}]
                 
                 # 2. Category nodes
-                cat_totals = cat_sub_totals.groupby('category')['spending'].sum().reset_index()
+                cat_totals = cat_sub_totals.groupby('category', observed=True, sort=False)['spending'].sum().reset_index()
                 cat_totals = cat_totals.sort_values('spending', ascending=True)
                 
-                for _, row in cat_totals.iterrows():
+                for row in cat_totals.to_dict('records'):
                     sun_data.append({
                         "id": f"CAT_{row['category']}",
                         "label": row['category'],
@@ -268,7 +521,7 @@ def view_analytics():
                     })
                 
                 # 3. Subcategory nodes
-                for _, row in cat_sub_totals.iterrows():
+                for row in cat_sub_totals.to_dict('records'):
                     sun_data.append({
                         "id": f"SUB_{row['category']}_{row['subcategory']}",
                         "label": row['subcategory'],
@@ -279,10 +532,9 @@ def view_analytics():
                 df_sun = pd.DataFrame(sun_data)
                 
                 # Create custom text labels (hide for ROOT to keep center empty)
-                df_sun['display_text'] = df_sun.apply(
-                    lambda x: f"<b>{x['label']}</b><br>{x['value']:,.0f} PLN" if x['id'] != 'ROOT' else "",
-                    axis=1
-                )
+                df_sun['display_text'] = (
+                    "<b>" + df_sun['label'] + "</b><br>" + df_sun['value'].map("{:,.0f}".format) + " PLN"
+                ).where(df_sun['id'] != 'ROOT', "")
                 
                 # Create Sunburst with Drill-down
                 fig_sunburst = px.sunburst(
@@ -320,11 +572,15 @@ def view_analytics():
     with c2:
         st.subheader("Categories")
         if not df_spending.empty:
-            # We use the cat_totals calculated in c1 block
-            # If cat_totals is not available (c1 branch failed), we calculate it
-            cat_totals = df_spending.groupby('category')['amount'].sum().reset_index()
-            cat_totals['spending'] = cat_totals['amount'].apply(lambda x: abs(x) if x < 0 else 0)
-            cat_totals = cat_totals[cat_totals['spending'] > 0].sort_values('spending', ascending=True)
+            # Net per category (not the sum of clipped subcategories the sunburst shows).
+            # Stays a Series until the few surviving rows are framed for plotly.
+            cat_spending = (-df_spending.groupby('category', observed=True, sort=False)['amount'].sum()).clip(lower=0)
+            cat_totals = (
+                cat_spending[cat_spending > 0]
+                .sort_values(ascending=True)
+                .rename('spending')
+                .reset_index()
+            )
 
             if not cat_totals.empty:
                 fig_bar = px.bar(
@@ -405,16 +661,13 @@ def view_transactions_manager(mode: str = "all"):
     """
     st.title("📋 Transactions Manager")
 
+    # Transactions and categories are independent: load the transactions meanwhile
+    tx_future = run_in_background(load_transactions_frame, limit=5000, _refresh_key=st.session_state.refresh_key)
+
     # --- 1. Fetch Categories for Dropdown ---
-    cat_tree = fetch_categories_tree()
-    flat_categories = []
     # Add an empty option to allow clearing? Or handle it via None.
     # Streamlit SelectboxColumn typically requires options.
-    for c in cat_tree:
-        flat_categories.append(c['category'])
-        for s in c.get('subcategories', []):
-            flat_categories.append(f"{c['category']}: {s['category']}")
-    flat_categories.sort()
+    flat_categories = fetch_category_options()["flat"]
 
     # --- 1.5 Add Manual Transaction Form ---
     with st.expander("➕ Add New Transaction"):
@@ -453,7 +706,7 @@ def view_transactions_manager(mode: str = "all"):
                 }
                 
                 try:
-                    r = requests.post(f"{API_URL}/transactions/", json=payload)
+                    r = SESSION.post(f"{API_URL}/transactions/", json=payload)
                     if r.status_code == 200:
                         st.success("Transaction added!")
                         refresh_data()
@@ -482,15 +735,12 @@ def view_transactions_manager(mode: str = "all"):
 
     # Fetch Data
     # Ideally paginated API, but here we fetch 2000 or 5000
-    tx_data = fetch_transactions(limit=5000, _refresh_key=st.session_state.refresh_key)
+    df_tx = tx_future.result()
     
-    if not tx_data:
+    if df_tx.empty:
         st.info("No transactions found.")
         return
 
-    df_tx = pd.DataFrame(tx_data)
-    df_tx['date'] = pd.to_datetime(df_tx['date'])
-
     # Determine Date Bounds
     min_date = df_tx['date'].min().date()
     max_date = df_tx['date'].max().date()
@@ -504,9 +754,11 @@ def view_transactions_manager(mode: str = "all"):
             key="tx_mgr_date"
         )
     
-    # Filter Date
-    mask_date = (df_tx['date'].dt.date >= start_date) & (df_tx['date'].dt.date <= end_date)
-    df_tx = df_tx.loc[mask_date].copy()
+    # Filter Date (datetime64 vs Timestamp bounds, end day inclusive).
+    # The default range is all loaded rows, which needs no mask.
+    if start_date > min_date or end_date < max_date:
+        mask_date = (df_tx['date'] >= pd.Timestamp(start_date)) & (df_tx['date'] < pd.Timestamp(end_date) + pd.Timedelta(days=1))
+        df_tx = df_tx.loc[mask_date]
 
     # Mode Toggle
     with c_check:
@@ -516,16 +768,6 @@ def view_transactions_manager(mode: str = "all"):
         default_show_all = (mode == "all")
         show_all = st.checkbox("Show Categorized Transactions", value=default_show_all)
     
-    # Helper to create display string for category
-    def make_display(row):
-        if not row['category']: 
-            return None
-        if row['subcategory']:
-            return f"{row['category']}: {row['subcategory']}"
-        return row['category']
-        
-    df_tx['category_display'] = df_tx.apply(make_display, axis=1)
-
     # Filter by Categorization Status
     if not show_all:
         df_tx = df_tx[df_tx['category'].isna()]
@@ -541,8 +783,7 @@ def view_transactions_manager(mode: str = "all"):
     # Prepare columns
     # We want: ID (hidden?), Date, Merchant, Desc, Amount, Category(Dropdown)
     
-    # Ensure ID is string
-    df_tx['transaction_id'] = df_tx['transaction_id'].astype(str)
+    # (transaction_id is TEXT in the DB, so the Arrow table already hands us a string column)
     
     cols_to_show = ['transaction_id', 'date', 'merchant', 'description', 'amount', 'currency', 'category_display']
     
@@ -570,72 +811,60 @@ def view_transactions_manager(mode: str = "all"):
     )
 
     # --- 4. Save Logic ---
-    if st.button("Save Changes", type="primary"):
-        changes = 0
-        progress_bar = st.progress(0)
-        
-        # We iterate to find diffs.
+    save_clicked = st.button("Save Changes", type="primary")
+    if save_clicked and not editor_has_changes("tx_manager_editor"):
+        st.info("No changes detected to save.")
+    elif save_clicked:
+        # Find diffs column-wise.
         # edited_df has the current state of UI.
-        # df_tx has the state before editing (filtered).
+        # df_tx has the state before editing (filtered), same rows in the same order.
+        editable = ['category_display', 'merchant']
+        edited = edited_df.set_index('transaction_id')[editable]
+        original = df_tx.set_index('transaction_id')[editable]
         
-        # Optimization: iterate on edited_df, check against df_tx by ID
-        # Converting to dict for faster lookup
-        original_map = df_tx.set_index('transaction_id')[['category_display', 'merchant']].to_dict('index')
+        # Changed = values differ, unless both sides are missing (None/NaN/NA).
+        # A comparison with NA (category_display is a 'string' column) is NA, i.e. changed.
+        differs = edited.ne(original).fillna(True) & ~(edited.isna() & original.isna())
+        changed = edited[differs.any(axis=1)]
         
-        total_rows = len(edited_df)
-        processed = 0
+        # Only the changed rows become payloads; "category: subcategory" is split in one go
+        updates = []
+        if not changed.empty:
+            parts = changed['category_display'].fillna('').astype(str).str.partition(": ")
+            updates = [
+                {
+                    "transaction_id": tid,
+                    "category": cat or None,
+                    "subcategory": sub or None,
+                    "merchant": None if pd.isna(merch) else merch
+                }
+                for tid, cat, sub, merch in zip(changed.index, parts[0], parts[2], changed['merchant'])
+            ]
         
-        for index, row in edited_df.iterrows():
-            tid = row['transaction_id']
-            if tid not in original_map:
-                continue # Should not happen unless row ID changed?
-                
-            orig = original_map[tid]
-            
-            new_cat_str = row['category_display']
-            old_cat_str = orig['category_display']
-            
-            new_merch = row['merchant']
-            old_merch = orig['merchant']
-            
-            # Compare
-            # Handle None/NaN
-            cat_changed = (new_cat_str != old_cat_str)
-            if pd.isna(new_cat_str) and pd.isna(old_cat_str): cat_changed = False
-            
-            merch_changed = (new_merch != old_merch)
-            if pd.isna(new_merch) and pd.isna(old_merch): merch_changed = False
-            
-            if cat_changed or merch_changed:
-                # Prepare payload
-                cat, sub = None, None
-                
-                if pd.notna(new_cat_str) and new_cat_str:
-                    parts = new_cat_str.split(": ")
-                    cat = parts[0]
-                    if len(parts) > 1: sub = parts[1]
-                
-                try:
-                    requests.put(f"{API_URL}/transactions/{tid}/categorize", json={
-                        "category": cat,
-                        "subcategory": sub,
-                        "merchant": new_merch
-                    })
-                    changes += 1
-                except Exception as e:
-                    st.error(f"Error updating {tid}: {e}")
-            
-            processed += 1
-            if processed % 10 == 0:
-                progress_bar.progress(min(processed / total_rows, 1.0))
+        # A classification needs a category: rows left without one (cleared cell) are
+        # skipped, so they can't fail the whole bulk save
+        skipped = [u["transaction_id"] for u in updates if u["category"] is None]
+        if skipped:
+            updates = [u for u in updates if u["category"] is not None]
+            st.warning(f"Skipped {len(skipped)} transactions without a category: {', '.join(skipped)}")
         
-        progress_bar.empty()
+        # All edits in ONE request (one round trip, one DB transaction)
+        changes = 0
+        if updates:
+            try:
+                with st.spinner(f"Saving {len(updates)} transactions..."):
+                    r = SESSION.post(f"{API_URL}/transactions/bulk_categorize", json=updates, timeout=30)
+                r.raise_for_status()
+                changes = len(updates)
+            except Exception as e:
+                st.error(f"Error updating transactions: {e}")
         
         if changes > 0:
             st.success(f"Successfully updated {changes} transactions.")
             refresh_data() # Update global refresh key
-            st.rerun()
-        else:
+            if not skipped:
+                st.rerun() # (with skipped rows, stay so the warning remains readable)
+        elif not updates and not skipped:
             st.info("No changes detected to save.")
 
 
@@ -666,7 +895,7 @@ def view_management(tool):
                         files = {"file": (uploaded_file.name, uploaded_file.getvalue(), "text/csv")}
                         params = {"on_conflict": on_conflict}
                         
-                        response = requests.post(f"{API_URL}/import/upload", files=files, params=params)
+                        response = SESSION.post(f"{API_URL}/import/upload", files=files, params=params)
                         
                         if response.status_code == 200:
                             res = response.json()
@@ -697,28 +926,24 @@ def view_management(tool):
     elif tool == "Rules Editor":
         st.header("Manage Rules")
         
-        # 1. Fetch Data
+        # 1. Fetch Data (the category lists load in the background meanwhile)
+        options_future = run_in_background(fetch_category_options)
         rules_data = []
         try:
-            r = requests.get(f"{API_URL}/rules")
+            r = SESSION.get(f"{API_URL}/rules/")
             if r.status_code == 200:
-                rules_data = r.json()
+                rules_data = orjson.loads(r.content)
         except Exception as e:
             st.error(f"Failed to load rules: {e}")
 
         df_rules = pd.DataFrame(rules_data)
         
         # Prepare Dropdown Lists
-        cat_tree = fetch_categories_tree()
-        cat_map = {c['category']: c for c in cat_tree}
+        category_options = options_future.result()
         
-        all_categories = sorted(list(cat_map.keys()))
-        # Flatten subcategories for the second dropdown
-        all_subcategories = []
-        for c in cat_tree:
-            for s in c.get('subcategories', []):
-                all_subcategories.append(s['category'])
-        all_subcategories = sorted(list(set(all_subcategories)))
+        all_categories = category_options["main"]
+        # Flattened subcategories for the second dropdown
+        all_subcategories = category_options["subs"]
 
         # 2. Display Editor
         if not df_rules.empty:
@@ -772,53 +997,57 @@ def view_management(tool):
             )
             
             # 3. Handle Changes
-            if st.button("Save Changes"):
+            save_clicked = st.button("Save Changes")
+            if save_clicked and not editor_has_changes("rules_editor"):
+                st.info("No changes detected to save.")
+            elif save_clicked:
                 # Detect Added Rows
                 # data_editor state is complex.
                 # A simpler approach for MVP: Iterate rows and upsert.
                 # But 'edited_df' contains the FINAL state.
                 # Which rows are new? Those with NaN/None/0 ID.
                 
-                progress_text = st.empty()
-                updated_count = 0
-                created_count = 0
+                # Logic: If 'id' is present and valid (>0), it's an update.
+                # If 'id' is missing/NaN (new row in Editor), it's a create.
+                # Everything goes to the API in ONE bulk request (one round trip, one DB transaction)
+                is_existing = (edited_df['id'].notna() & (edited_df['id'] > 0)).tolist()
+                
+                def clean(value):
+                    # Empty editor cells come back as NaN, the API wants null
+                    return None if pd.isna(value) else value
                 
-                for index, row in edited_df.iterrows():
+                rule_payloads = []
+                for row, existing in zip(edited_df.to_dict('records'), is_existing):
                     rule_payload = {
-                        "pattern": row['pattern'],
-                        "match_type": row['match_type'],
-                        "source_column": row['source_column'],
-                        "merchant": row['merchant'],
-                        "category": row['category'],
-                        "subcategory": row['subcategory'],
-                        "conditions": row['conditions'],
+                        "pattern": clean(row['pattern']),
+                        "match_type": clean(row['match_type']),
+                        "source_column": clean(row['source_column']),
+                        "merchant": clean(row['merchant']),
+                        "category": clean(row['category']),
+                        "subcategory": clean(row['subcategory']),
+                        "conditions": clean(row['conditions']),
                         "priority": int(row['priority']) if pd.notna(row['priority']) else 10
                     }
-                    
-                    # Logic: If 'id' is present and valid (>0), it's an update.
-                    # If 'id' is missing/NaN (new row in Editor), it's a create.
-                    
-                    try:
-                        is_existing = pd.notna(row.get('id')) and row.get('id') > 0
-                        
-                        if is_existing:
-                            # Update
-                            rid = int(row['id'])
-                            # Compare with original to avoid spamming API? 
-                            # For MVP, we can just PUT all, or try to diff.
-                            # Let's PUT all for safety.
-                            requests.put(f"{API_URL}/rules/{rid}", json=rule_payload)
-                            updated_count += 1
-                        else:
-                            # Create - Check if pattern exists?
-                            if rule_payload['pattern']:
-                                requests.post(f"{API_URL}/rules/", json=rule_payload)
-                                created_count += 1
-                    except Exception as e:
-                        st.error(f"Error saving rule: {row['pattern']} - {e}")
+                    if existing:
+                        # Update (we PUT all for safety, no diffing)
+                        rule_payload["id"] = int(row['id'])
+                    elif not rule_payload['pattern']:
+                        # Create - skip rows without a pattern
+                        continue
+                    rule_payloads.append(rule_payload)
+                
+                updated_count = sum(1 for p in rule_payloads if "id" in p)
+                created_count = len(rule_payloads) - updated_count
                 
-                st.success(f"Saved! Updated: {updated_count}, Created: {created_count}")
-                st.rerun() # Refresh to get new IDs
+                try:
+                    response = SESSION.post(f"{API_URL}/rules/bulk", json=rule_payloads)
+                    if response.status_code == 200:
+                        st.success(f"Saved! Updated: {updated_count}, Created: {created_count}")
+                        st.rerun() # Refresh to get new IDs
+                    else:
+                        st.error(f"Error saving rules: {response.text}")
+                except Exception as e:
+                    st.error(f"Error saving rules: {e}")
         else:
             st.info("No rules found. Add one manually?")
 
@@ -830,38 +1059,7 @@ def view_management(tool):
         cat_tree = fetch_categories_tree()
         
         if cat_tree:
-            # Flatten for Plotly Sunburst
-            # Columns: [id, label, parent]
-            sunburst_data = []
-            
-            # Root node
-            sunburst_data.append({"id": "ROOT", "label": "Expenses", "parent": ""})
-            
-            for main_cat in cat_tree:
-                mid = f"M_{main_cat['category_id']}"
-                sunburst_data.append({
-                    "id": mid, 
-                    "label": main_cat['category'], 
-                    "parent": "ROOT"
-                })
-                
-                for sub in main_cat.get('subcategories', []):
-                    sid = f"S_{sub['category_id']}"
-                    sunburst_data.append({
-                        "id": sid,
-                        "label": sub['category'],
-                        "parent": mid
-                    })
-            
-            df_sun = pd.DataFrame(sunburst_data)
-            fig = px.sunburst(
-                df_sun,
-                names='label',
-                parents='parent',
-                ids='id',
-            )
-            fig.update_layout(margin=dict(t=0, l=0, r=0, b=0))
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(build_category_sunburst(), use_container_width=True)
 
         st.markdown("---")
         
@@ -875,23 +1073,32 @@ def view_management(tool):
             if c2.form_submit_button("Add Group"):
                 if new_main_name:
                     try:
-                        requests.post(f"{API_URL}/categories/", json={"category": new_main_name})
+                        SESSION.post(f"{API_URL}/categories/", json={"category": new_main_name})
                         st.success("Created!")
-                        fetch_categories_tree.clear()
+                        clear_categories_cache()
                         st.rerun()
                     except Exception as e:
                         st.error(f"Error: {e}")
 
         # Iterate Main Categories
         for main_cat in cat_tree:
-            with st.expander(f"📁 {main_cat['category']} ({len(main_cat.get('subcategories', []))} items)"):
+            # State-tracking expander: a closed group reruns nothing inside it, so only
+            # the open group(s) build a rename popover and a subcategory data_editor
+            group = st.expander(
+                f"📁 {main_cat['category']} ({len(main_cat.get('subcategories', []))} items)",
+                key=f"group_{main_cat['category_id']}",
+                on_change="rerun"
+            )
+            if not group.open:
+                continue
+            with group:
                 
                 # A. Rename Main Category
                 with st.popover("Rename Group"):
                     new_name = st.text_input("New Name", value=main_cat['category'], key=f"ren_{main_cat['category_id']}")
                     if st.button("Update Name", key=f"btn_ren_{main_cat['category_id']}"):
-                         requests.put(f"{API_URL}/categories/{main_cat['category_id']}", json={"category": new_name})
-                         fetch_categories_tree.clear()
+                         SESSION.put(f"{API_URL}/categories/{main_cat['category_id']}", json={"category": new_name})
+                         clear_categories_cache()
                          st.rerun()
                 
                 # B. Subcategories Editor
@@ -918,7 +1125,10 @@ def view_management(tool):
                 )
                 
                 # C. Save Changes
-                if st.button("Save Changes", key=f"save_{main_cat['category_id']}"):
+                save_clicked = st.button("Save Changes", key=f"save_{main_cat['category_id']}")
+                if save_clicked and not editor_has_changes(f"editor_{main_cat['category_id']}"):
+                    st.info("No changes detected to save.")
+                elif save_clicked:
                     # Logic to detect diffs is hard with dynamic rows.
                     # Simplified: 
                     # 1. Existing rows (have ID) -> Update
@@ -926,34 +1136,40 @@ def view_management(tool):
                     # 3. Deleted rows -> Delete (This is tricky with data_editor, as it returns the FINAL state)
                     # To handle deletions, we need to know what WAS there.
                     
-                    current_ids = {row['category_id'] for row in subs}
+                    original_names = {row['category_id']: row['category'] for row in subs}
                     final_ids = set()
+                    changes = {"create": [], "update": [], "delete": []}
                     
-                    for index, row in edited_subs.iterrows():
+                    for row in edited_subs.to_dict('records'):
                         # Handle New
                         if pd.isna(row.get('category_id')):
-                             requests.post(f"{API_URL}/categories/", json={
-                                 "category": row['category'],
-                                 "parent_id": main_cat['category_id']
-                             })
+                            changes["create"].append({
+                                "category": row['category'],
+                                "parent_id": main_cat['category_id']
+                            })
                         else:
                             # Handle Update
                             cid = int(row['category_id'])
                             final_ids.add(cid)
-                            # Check if name changed to save API calls
-                            orig = next((x for x in subs if x['category_id'] == cid), None)
-                            if orig and orig['category'] != row['category']:
-                                requests.put(f"{API_URL}/categories/{cid}", json={"category": row['category']})
+                            # Check if name changed to keep the payload small
+                            if cid in original_names and original_names[cid] != row['category']:
+                                changes["update"].append({"category_id": cid, "category": row['category']})
                     
                     # Handle Deletions
                     # If ID was in current but not in final, it was deleted.
-                    to_delete = current_ids - final_ids
-                    for did in to_delete:
-                        requests.delete(f"{API_URL}/categories/{did}")
+                    changes["delete"] = list(original_names.keys() - final_ids)
                     
-                    st.success("Saved!")
-                    fetch_categories_tree.clear()
-                    st.rerun()
+                    # The whole diff goes out in ONE request, applied in one DB transaction
+                    try:
+                        response = SESSION.post(f"{API_URL}/categories/bulk", json=changes)
+                        clear_categories_cache()
+                        if response.status_code == 204:
+                            st.success("Saved!")
+                            st.rerun()
+                        else:
+                            st.error(f"Error saving categories: {response.text}")
+                    except requests.RequestException as e:
+                        st.error(f"Error saving categories: {e}")
 
 
     # elif tool == "Manual Categorization":
@@ -1032,12 +1248,10 @@ if __name__ == "__main__":
     )
     
     # Check Backend Status (moved to bottom)
+    # The check runs alongside the view's own fetches; its slot is reserved here, filled after routing
     st.sidebar.markdown("---")
-    try:
-        health = requests.get(f"{API_URL.replace('/api', '')}/").json()
-        st.sidebar.caption(f"✅ Backend Connected")
-    except:
-        st.sidebar.error("Backend Disconnected")
+    backend_status = st.sidebar.empty()
+    health = run_in_background(backend_is_up)
 
     # --- Routing ---
     if st.session_state.current_view == "Dashboard":
@@ -1049,3 +1263,8 @@ if __name__ == "__main__":
     else:
         view_management(st.session_state.current_view)
 
+    if health.result():
+        backend_status.caption(f"✅ Backend Connected")
+    else:
+        backend_status.error("Backend Disconnected")
+
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# app.py is a Streamlit script, not a package: import it from dashboard/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
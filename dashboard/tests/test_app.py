@@ -0,0 +1,32 @@
+import pyarrow as pa
+import pytest
+
+import app
+
+@pytest.fixture
+def transactions(monkeypatch):
+    """Serve the given Arrow table instead of calling the API."""
+    def serve(table):
+        monkeypatch.setattr(app, "fetch_transactions", lambda **kwargs: table)
+        app.load_transactions_frame.clear()
+    yield serve
+    app.load_transactions_frame.clear()
+
+def test_category_display_without_any_subcategory(transactions):
+    # A JSON page where no row has a subcategory: Arrow infers a null column
+    transactions(pa.Table.from_pylist([
+        {"transaction_id": "t1", "category": "food", "subcategory": None},
+        {"transaction_id": "t2", "category": None, "subcategory": None},
+    ]))
+    df = app.load_transactions_frame()
+    assert df["category_display"].tolist()[0] == "food"
+    assert df["category_display"].isna().tolist() == [False, True]
+
+def test_category_display_with_subcategories(transactions):
+    transactions(pa.table({
+        "transaction_id": ["t1", "t2", "t3", "t4"],
+        "category": ["food", "food", "", None],
+        "subcategory": ["bakery", None, None, "x"],
+    }))
+    df = app.load_transactions_frame()
+    assert df["category_display"].fillna("<NA>").tolist() == ["food: bakery", "food", "<NA>", "<NA>"]
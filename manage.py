@@ -44,6 +44,33 @@ def cmd_init_db(args):
     with open(schema_path, "r", encoding="utf-8") as f:
         conn.executescript(f.read())
     
+    # Databases created before transactions.current_* existed: add the columns and backfill
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(transactions)")}
+    missing = [
+        (name, col_type) for name, col_type in [
+            ("current_category", "TEXT"),
+            ("current_subcategory", "TEXT"),
+            ("current_category_id", "INTEGER"),
+            ("current_merchant", "TEXT"),
+        ] if name not in existing
+    ]
+    if missing:
+        for name, col_type in missing:
+            conn.execute(f"ALTER TABLE transactions ADD COLUMN {name} {col_type}")
+        conn.execute("""
+            UPDATE transactions
+            SET (current_category, current_subcategory, current_category_id, current_merchant) = (
+                SELECT category, subcategory, category_id, merchant
+                FROM transaction_classifications tc
+                WHERE tc.transaction_id = transactions.transaction_id AND tc.is_current = 1
+                ORDER BY classification_id DESC
+                LIMIT 1
+            )
+        """)
+        print(f"Added {len(missing)} column(s) to transactions and backfilled them.")
+    
+    # Give the query planner statistics for the indexes
+    conn.execute("ANALYZE")
     conn.commit()
     conn.close()
     print("Done.")
@@ -58,7 +85,7 @@ def cmd_load_rules(args):
     print(f"Loading rules from {csv_path}...")
     conn = get_db_connection()
     try:
-        conn.execute("BEGIN")
+        conn.execute("BEGIN IMMEDIATE")
         count = load_rules_from_csv(conn, csv_path, clear_existing=args.clear)
         conn.commit()
         print(f"Successfully loaded {count} rules.")
@@ -78,7 +105,7 @@ def cmd_load_categories(args):
     print(f"Loading categories from {csv_path}...")
     conn = get_db_connection()
     try:
-        conn.execute("BEGIN")
+        conn.execute("BEGIN IMMEDIATE")
         # Ensure foreign keys are on? Though load_categories handles one atomic operation usually.
         load_categories_from_csv(conn, csv_path, clear_existing=args.clear)
         conn.commit()
@@ -18,6 +18,40 @@ CREATE TABLE IF NOT EXISTS categories (
 CREATE INDEX IF NOT EXISTS idx_categories_parent
   ON categories(parent_id);
 
+-- ============================================================
+-- Meta (key/value counters)
+--    categories_version is bumped on every change to categories;
+--    GET /categories serves it as the ETag.
+--    transactions_version is bumped by the app (bump_version) after every
+--    write to transactions / their current classification; it tags the API's
+--    cached transaction pages. Per-row triggers would slow imports down too much.
+-- ============================================================
+CREATE TABLE IF NOT EXISTS meta (
+  key              TEXT PRIMARY KEY,
+  value            INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO meta (key, value) VALUES ('categories_version', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('transactions_version', 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_categories_version_insert
+AFTER INSERT ON categories
+BEGIN
+  UPDATE meta SET value = value + 1 WHERE key = 'categories_version';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_categories_version_update
+AFTER UPDATE ON categories
+BEGIN
+  UPDATE meta SET value = value + 1 WHERE key = 'categories_version';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_categories_version_delete
+AFTER DELETE ON categories
+BEGIN
+  UPDATE meta SET value = value + 1 WHERE key = 'categories_version';
+END;
+
 -- SQLBook: Code
 PRAGMA foreign_keys = ON;
 
@@ -35,6 +69,11 @@ CREATE TABLE IF NOT EXISTS import_batches (
 CREATE INDEX IF NOT EXISTS idx_import_batches_imported_at
   ON import_batches(imported_at);
 
+-- Batch that manually created transactions (API) belong to;
+-- must exist since connections run with foreign_keys = ON
+INSERT OR IGNORE INTO import_batches (import_batch_id, source_file_name)
+VALUES ('manual', NULL);
+
 -- ============================================================
 -- 2) Transactions (facts)
 -- ============================================================
@@ -50,6 +89,13 @@ CREATE TABLE IF NOT EXISTS transactions (
   import_batch_id    TEXT NOT NULL,
   created_at         TEXT NOT NULL DEFAULT (datetime('now')),
 
+  -- Copy of the current classification (is_current=1), kept in sync by the
+  -- trg_tx_classif_current_* triggers so listings don't need the join
+  current_category      TEXT,
+  current_subcategory   TEXT,
+  current_category_id   INTEGER,
+  current_merchant      TEXT,
+
   FOREIGN KEY (import_batch_id) REFERENCES import_batches(import_batch_id)
     ON UPDATE CASCADE
     ON DELETE RESTRICT
@@ -64,6 +110,10 @@ CREATE INDEX IF NOT EXISTS idx_transactions_import_batch
 CREATE INDEX IF NOT EXISTS idx_transactions_amount
   ON transactions(amount);
 
+-- Newest-first listing; transaction_id makes the order (and page boundaries) stable
+CREATE INDEX IF NOT EXISTS idx_transactions_date_id
+  ON transactions(date, transaction_id);
+
 -- ============================================================
 -- 3) Rules (configuration)
 --    Rules for automatic transaction classification
@@ -93,7 +143,8 @@ CREATE INDEX IF NOT EXISTS idx_rules_match_type
 -- ============================================================
 -- 4) Transaction classifications (category interpretation)
 --    Supports history + manual overrides.
---    Exactly one is_current=1 per transaction should be maintained by app logic.
+--    Exactly one is_current=1 per transaction: enforced by ux_tx_classif_current,
+--    and trg_tx_classif_retire_current retires the old row on insert.
 -- ============================================================
 CREATE TABLE IF NOT EXISTS transaction_classifications (
   classification_id  INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -119,8 +170,13 @@ CREATE TABLE IF NOT EXISTS transaction_classifications (
     ON DELETE SET NULL
 );
 
-CREATE INDEX IF NOT EXISTS idx_tx_classif_tx_current
-  ON transaction_classifications(transaction_id, is_current);
+-- Covers "current classification" lookups by transaction_id (e.g. the
+-- classifier's unclassified check), so they are answered from the index alone. Supersedes the old
+-- (transaction_id, is_current) index, which is a prefix of this one.
+DROP INDEX IF EXISTS idx_tx_classif_tx_current;
+
+CREATE INDEX IF NOT EXISTS idx_tx_classif_current_cover
+  ON transaction_classifications(transaction_id, is_current, category, subcategory, category_id, merchant);
 
 CREATE INDEX IF NOT EXISTS idx_tx_classif_current
   ON transaction_classifications(is_current);
@@ -128,6 +184,66 @@ CREATE INDEX IF NOT EXISTS idx_tx_classif_current
 CREATE INDEX IF NOT EXISTS idx_tx_classif_category_current
   ON transaction_classifications(category, is_current);
 
+-- Usage check before deleting a category
+CREATE INDEX IF NOT EXISTS idx_tx_classif_category_id
+  ON transaction_classifications(category_id);
+
+-- Retire duplicate current rows left by older app versions (keep the newest),
+-- otherwise the unique index below can't be built
+UPDATE transaction_classifications
+SET is_current = 0
+WHERE is_current = 1
+  AND classification_id NOT IN (
+    SELECT MAX(classification_id)
+    FROM transaction_classifications
+    WHERE is_current = 1
+    GROUP BY transaction_id
+  );
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_tx_classif_current
+  ON transaction_classifications(transaction_id)
+  WHERE is_current = 1;
+
+-- Inserting a current classification retires the previous one in the same
+-- statement, so re-categorizing is a single INSERT
+CREATE TRIGGER IF NOT EXISTS trg_tx_classif_retire_current
+BEFORE INSERT ON transaction_classifications
+WHEN NEW.is_current = 1
+BEGIN
+  UPDATE transaction_classifications
+  SET is_current = 0
+  WHERE transaction_id = NEW.transaction_id AND is_current = 1;
+END;
+
+-- Keep transactions.current_* in sync with the current classification.
+-- A new current row is copied over; any other change re-reads whichever row is
+-- current now (NULLs if none, e.g. right after the old one was retired).
+CREATE TRIGGER IF NOT EXISTS trg_tx_classif_current_insert
+AFTER INSERT ON transaction_classifications
+WHEN NEW.is_current = 1
+BEGIN
+  UPDATE transactions
+  SET current_category    = NEW.category,
+      current_subcategory = NEW.subcategory,
+      current_category_id = NEW.category_id,
+      current_merchant    = NEW.merchant
+  WHERE transaction_id = NEW.transaction_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tx_classif_current_update
+AFTER UPDATE OF is_current, category, subcategory, category_id, merchant ON transaction_classifications
+BEGIN
+  UPDATE transactions
+  SET (current_category, current_subcategory, current_category_id, current_merchant) = (
+      SELECT category, subcategory, category_id, merchant
+      FROM transaction_classifications
+      WHERE transaction_id = NEW.transaction_id AND is_current = 1
+      ORDER BY classification_id DESC
+      LIMIT 1
+  )
+  WHERE transaction_id = NEW.transaction_id;
+END;
+
 -- ============================================================
 -- 5) Transaction flags (flag interpretation)
 --    Flags are snake_case strings (e.g. 'is_reimbursement', 'is_savings').